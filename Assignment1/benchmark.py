@@ -0,0 +1,157 @@
+"""
+    File for benchmarking search configurations of solve_weighted_sokoban
+    on the warehouses/ corpus.
+
+    Each warehouse is solved once per configuration in a separate process
+    (see testing.run_with_timeout) and the following are printed:
+        cost, time taken, nodes expanded and expansion rate (nodes per second).
+
+    A configuration is a dictionary of keyword arguments for solve_weighted_sokoban.
+"""
+
+import os
+import glob
+import time
+from functools import partial
+
+import search
+import sokoban
+import mySokobanSolver as solver
+from testing import run_with_timeout
+
+
+WAREHOUSE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouses')
+
+# 'priority_queue' is the open list of the original search.py, the baseline
+FRONTIER_CONFIGS = {
+    'priority_queue': {'frontier': 'priority_queue'},
+    'heap': {'frontier': 'heap'},
+    'bucket': {'frontier': 'bucket'},
+}
+
+BACKEND_CONFIGS = {
+    'tuple': {'backend': 'tuple', 'mode': 'step'},
+    'bitboard': {'backend': 'bitboard', 'mode': 'step'},
+}
+
+MODE_CONFIGS = {
+    'step': {'mode': 'step'},
+    'push': {'mode': 'push'},
+}
+
+HEURISTIC_CONFIGS = {
+    'manhattan': {'heuristic': 'manhattan'},
+    'push': {'heuristic': 'push'},
+    'matching': {'heuristic': 'matching'},
+}
+
+# Scaling of hash-distributed A* with the number of worker processes.
+# The workers report their expansions through the SearchStats of the solve.
+# Passing the children between the processes costs more than the parallel
+# expansions save on this corpus: on warehouse_035, hda*4 took 5.85 s
+# against 1.99 s for astar.
+WORKER_CONFIGS = {
+    'astar': {'engine': 'astar'},
+    'hda*1': {'engine': 'hdastar', 'workers': 1},
+    'hda*2': {'engine': 'hdastar', 'workers': 2},
+    'hda*4': {'engine': 'hdastar', 'workers': 4},
+    'hda*8': {'engine': 'hdastar', 'workers': 8},
+}
+
+
+def measure(file_path, options):
+    """ Solve a warehouse with the given options. Returns (cost, time taken, nodes expanded). """
+    wh = sokoban.Warehouse()
+    wh.load_warehouse(file_path)
+
+    # The statistics also count the expansions of the hdastar worker processes
+    start_time = time.time()
+    _, cost, stats = solver.solve_weighted_sokoban(wh, return_stats=True, **options)
+    time_taken = time.time() - start_time
+
+    return cost, time_taken, stats.expanded
+
+
+def run_benchmark(configs, warehouses=None, timeout=60):
+    """ Run every configuration on every warehouse and print one line per run.
+        Params:
+            configs: dictionary of configuration name -> solve_weighted_sokoban options.
+            warehouses: list of warehouse file names (default: the whole corpus).
+            timeout: time limit in seconds for each run.
+        Returns:
+            dictionary of (warehouse, configuration name) -> (cost, time taken, nodes expanded),
+            None for the runs that timed out.
+    """
+    if warehouses is None:
+        warehouses = sorted(os.path.basename(f) for f in glob.glob(os.path.join(WAREHOUSE_DIR, '*.txt')))
+
+    results = {}
+    print(f"{'Warehouse':<32}{'Config':<16}{'Cost':>8}{'Time (s)':>10}{'Expanded':>10}{'Nodes/s':>10}")
+    for name in warehouses:
+        for config_name, options in configs.items():
+            func = partial(measure, os.path.join(WAREHOUSE_DIR, name), options)
+            result = run_with_timeout(func, timeout)
+            results[(name, config_name)] = result
+            if result is None:
+                print(f"{name:<32}{config_name:<16}{'Timeout':>8}")
+                continue
+            cost, time_taken, expanded = result
+            rate = expanded / time_taken if time_taken > 0 else float('inf')
+            print(f"{name:<32}{config_name:<16}{str(cost):>8}{time_taken:>10.2f}{expanded:>10}{rate:>10.0f}")
+
+    return results
+
+
+def run_portfolio(strategies=None, warehouses=None, timeout=60):
+    """ Race the strategies on every warehouse (see solve_weighted_sokoban_portfolio)
+        and print one line per warehouse with the winning strategy.
+        Params:
+            strategies: dictionary of strategy name -> solve_weighted_sokoban options
+                (default: solver.PORTFOLIO_STRATEGIES).
+            warehouses: list of warehouse file names (default: the whole corpus).
+            timeout: time limit in seconds for each warehouse.
+        Returns:
+            dictionary of warehouse -> (cost, time taken, winning strategy),
+            None for the warehouses that timed out.
+    """
+    if warehouses is None:
+        warehouses = sorted(os.path.basename(f) for f in glob.glob(os.path.join(WAREHOUSE_DIR, '*.txt')))
+
+    results = {}
+    print(f"{'Warehouse':<32}{'Winner':<16}{'Cost':>8}{'Time (s)':>10}")
+    for name in warehouses:
+        wh = sokoban.Warehouse()
+        wh.load_warehouse(os.path.join(WAREHOUSE_DIR, name))
+        report = {}
+        start_time = time.time()
+        S, cost = solver.solve_weighted_sokoban_portfolio(wh, strategies, timeout, report)
+        time_taken = time.time() - start_time
+        if S is None:
+            results[name] = None
+            print(f"{name:<32}{'-':<16}{'Timeout':>8}")
+            continue
+        # Plans that are not proven least-cost are marked with a *
+        winner = report['strategy'] + ('' if report['proven'] else '*')
+        results[name] = (cost, time_taken, winner)
+        print(f"{name:<32}{winner:<16}{str(cost):>8}{time_taken:>10.2f}")
+
+    return results
+
+
+if __name__ == '__main__':
+    # Compare the original PriorityQueue, the indexed binary heap and the bucket open list
+    run_benchmark(FRONTIER_CONFIGS, timeout=60)
+    # Compare the tuple and bitboard state representations
+    run_benchmark(BACKEND_CONFIGS, timeout=60)
+    # Compare searching over single moves and over pushes
+    run_benchmark(MODE_CONFIGS, timeout=60)
+    # Compare the heuristics (nodes expanded and time taken)
+    run_benchmark(HEURISTIC_CONFIGS, timeout=60)
+    # Compare A* with hash-distributed A* on 1 to 8 processes
+    if search.fork_context() is None:
+        # hdastar_search would run A* in this process for every configuration
+        print("Skipping the hdastar configurations: fork is not available on this platform.")
+    else:
+        run_benchmark(WORKER_CONFIGS, timeout=60)
+    # Race the portfolio strategies and show which one wins each level
+    run_portfolio(timeout=60)
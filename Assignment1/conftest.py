@@ -0,0 +1,65 @@
+'''
+
+Shared fixtures of the pytest suite, run with pytest from this directory.
+
+'''
+
+import os
+
+import pytest
+
+from sokoban import Warehouse
+
+import mySokobanSolver as solver
+
+# test_analysis.py is a script that reads the batch reports at import time,
+# not a test module
+collect_ignore = ['test_analysis.py']
+
+# The warehouses are found relative to this file, wherever pytest is run from
+WAREHOUSE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouses')
+
+
+@pytest.fixture
+def load():
+    """ Return a function loading warehouses/warehouse_<name>.txt. """
+    def load(name):
+        wh = Warehouse()
+        wh.load_warehouse(os.path.join(WAREHOUSE_DIR, 'warehouse_{}.txt'.format(name)))
+        return wh
+    return load
+
+
+@pytest.fixture
+def from_lines():
+    """ Return a function making a warehouse from a list of lines. """
+    def from_lines(lines):
+        wh = Warehouse()
+        wh.from_lines(lines)
+        return wh
+    return from_lines
+
+
+@pytest.fixture
+def replay():
+    """ Return a function executing a plan on a warehouse, see below. """
+    def replay(wh, plan):
+        """ Execute a plan and return its cost, None if it is illegal or does not solve the warehouse. """
+        walls, targets = set(wh.walls), set(wh.targets)
+        boxes = dict(zip(wh.boxes, wh.weights))
+        worker, cost = wh.worker, 0
+        for action in plan:
+            dx, dy = solver.deltas[action]
+            worker = (worker[0] + dx, worker[1] + dy)
+            if worker in walls:
+                return None
+            cost += 1
+            if worker in boxes:
+                next_box = (worker[0] + dx, worker[1] + dy)
+                if next_box in walls or next_box in boxes:
+                    return None
+                weight = boxes.pop(worker)
+                boxes[next_box] = weight
+                cost += weight
+        return cost if set(boxes) <= targets else None
+    return replay
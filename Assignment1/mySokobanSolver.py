@@ -30,6 +30,16 @@ Last modified by 2021-08-17  by f.maire@qut.edu.au
 import search 
 import sokoban
 import re
+import os
+import sys
+import queue
+import time
+import json
+import math
+import functools
+import itertools
+import collections
+import multiprocessing
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 
@@ -86,7 +96,7 @@ def find_corners(warehouse):
     lines = process_lines(wh_string)
 
     # Find all empty cells inside the warehouse
-    wall_pos = warehouse.walls  # list of tuples [(x,y)...]
+    wall_pos = set(warehouse.walls)  # set of tuples {(x,y)...}
 
     # Record blank cells (inside the warehouse)
     blank_pos = []  # a list of tuples
@@ -181,7 +191,7 @@ def check_walls(warehouse, corners: list[tuple[int,int]]) -> list[tuple[int,int]
     
     # Use a set to prevent duplicates
     along_wall_set = set()  # use a set instead of a list to avoid duplicates
-    walls = warehouse.walls
+    walls = set(warehouse.walls)
 
     for corner_pair in corner_pairs:
         # Unpack corner pair and direction
@@ -268,7 +278,7 @@ def taboo_cells(warehouse) -> str:
         The returned string should NOT have marks for the worker,
         the targets, and the boxes.
     """
-    taboo_cells_coords = find_taboo_cells(warehouse)
+    taboo_cells_coords = set(find_taboo_cells(warehouse))
 
     warehouse_string = warehouse.__str__()
 
@@ -349,29 +359,359 @@ def move_warehouse(current_warehouse, action):
     resulting_warehouse = current_warehouse.copy(worker=new_worker_pos, boxes=new_box_positions) 
     return resulting_warehouse
 
-def add_weights_to_string(warehouse_obj, warehouse_string):
+def push_distance_tables(walls, targets, nrows: int, ncols: int) -> np.ndarray:
     """
-    Add the weights to the warehouse string in the correct order.
-    The boxes in the warehouse are ordered by y-coordinate first, then x-coordinate.
+    Compute the number of pushes needed to bring a box from each cell to each
+    target, taking the walls into account but ignoring the other boxes.
+    The distances are found by a reverse ("pull") breadth first search from
+    every target: a box on cell c can be pulled to c+d if the worker can stand
+    on c+d and step back to c+2d, i.e. neither is a wall.
+    :param walls: set of wall positions.
+    :param targets: list of target positions.
+    :param nrows: number of rows of the warehouse.
+    :param ncols: number of columns of the warehouse.
+    :return: array of shape (len(targets), nrows, ncols). Entry [t, y, x] is the
+        number of pushes from (x,y) to targets[t], np.inf if it is impossible.
     """
-    # Get the boxes in the NEW warehouse
-    boxes = warehouse_obj.boxes
-    
-    # Create a mapping from current box positions to weights
-    weights = warehouse_obj.weights
-    box_weight_map = dict(zip(warehouse_obj.boxes, warehouse_obj.weights))
-    
-    # Sort boxes in reading order (y, x)
-    sorted_boxes = sorted(boxes, key=lambda pos: (pos[1], pos[0]))
-    
-    # Get weights in the correct order based on the sorted boxes
-    reordered_weights = [box_weight_map[box] for box in sorted_boxes]
-    
-    # Convert weights list to a space-separated string
-    weights_str = " ".join(str(w) for w in reordered_weights)
+    tables = np.full((len(targets), nrows, ncols), np.inf)
+
+    def is_free(x, y):
+        return 0 <= x < ncols and 0 <= y < nrows and (x, y) not in walls
+
+    for t, target in enumerate(targets):
+        tables[t, target[1], target[0]] = 0
+        frontier = collections.deque([target])
+        while frontier:
+            x, y = frontier.popleft()
+            distance = tables[t, y, x] + 1
+            for dx, dy in deltas.values():
+                if is_free(x + dx, y + dy) and is_free(x + 2 * dx, y + 2 * dy) and \
+                   tables[t, y + dy, x + dx] == np.inf:
+                    tables[t, y + dy, x + dx] = distance
+                    frontier.append((x + dx, y + dy))
+
+    return tables
+
+def pull_reachable_grid(free: np.ndarray, targets) -> np.ndarray:
+    """
+    Find the cells from which a box can be pushed to at least one target,
+    taking the walls into account but ignoring the other boxes.
+    A single breadth first search of pull moves starts from all the targets:
+    a box on cell c can be pulled to c+d if neither c+d nor c+2d is a wall.
+    :param free: boolean array of shape (nrows, ncols), True for the non-wall cells.
+    :param targets: collection of target positions (x,y).
+    :return: boolean array of shape (nrows, ncols), True for the cells from
+        which some target can be reached.
+    """
+    nrows, ncols = free.shape
+    live = np.zeros_like(free)
+    frontier = collections.deque()
+    for x, y in targets:
+        live[y, x] = True
+        frontier.append((x, y))
+    while frontier:
+        x, y = frontier.popleft()
+        for dx, dy in deltas.values():
+            x1, y1, x2, y2 = x + dx, y + dy, x + 2 * dx, y + 2 * dy
+            if 0 <= x2 < ncols and 0 <= y2 < nrows and 0 <= x1 < ncols and 0 <= y1 < nrows and \
+               free[y1, x1] and free[y2, x2] and not live[y1, x1]:
+                live[y1, x1] = True
+                frontier.append((x1, y1))
+    return live
+
+def dead_squares(warehouse) -> list[tuple[int,int]]:
+    """
+    Find the (x,y) coordinates of every dead square of the warehouse: the
+    cells inside the warehouse from which no box can ever be pushed to a
+    target, even with no other box in the way.
+    Every taboo cell of find_taboo_cells is a dead square, but dead squares
+    also include e.g. cells along a wall that ends in a dead end, or cells
+    that can only be left by pushing into a corner.
+    Unlike taboo_cells, this is not limited to the two taboo rules.
+    :param warehouse: a Warehouse object with a worker inside the warehouse.
+    :return: a list of tuples (x,y) containing the coordinates of all dead squares.
+    """
+    free = np.ones((warehouse.nrows, warehouse.ncols), dtype=bool)
+    for x, y in warehouse.walls:
+        free[y, x] = False
+    live = pull_reachable_grid(free, warehouse.targets)
+
+    # Cells inside the warehouse: the cells the worker can walk to, ignoring the boxes
+    inside = np.zeros_like(free)
+    inside[warehouse.worker[1], warehouse.worker[0]] = True
+    frontier = [warehouse.worker]
+    while frontier:
+        x, y = frontier.pop()
+        for dx, dy in deltas.values():
+            if 0 <= x + dx < warehouse.ncols and 0 <= y + dy < warehouse.nrows and \
+               free[y + dy, x + dx] and not inside[y + dy, x + dx]:
+                inside[y + dy, x + dx] = True
+                frontier.append((x + dx, y + dy))
+
+    return [(int(x), int(y)) for y, x in zip(*np.nonzero(inside & ~live))]
+
+# Cost of an impossible box-target pair in the assignment problems
+# (an assignment costing this much or more is infeasible)
+INFEASIBLE_COST = 10 ** 9
+
+def assign_row(cost, row: int, u: list, v: list, p: list):
+    """
+    Add one row to an optimal partial assignment with the shortest augmenting
+    path step of the Hungarian algorithm (Kuhn-Munkres, O(n^2) per row).
+    Rows and columns are numbered from 1, index 0 is used by the algorithm.
+    Requires feasible potentials, u[i] + v[j] <= cost[i-1][j-1], that are tight
+    on the assigned pairs. Keeps them so.
+    :param cost: square cost matrix (list of lists, 0-indexed).
+    :param row: the unassigned row to add (1-indexed).
+    :param u: row potentials, updated in place.
+    :param v: column potentials, updated in place.
+    :param p: p[j] is the row assigned to column j (0 if none), updated in place.
+    """
+    n = len(cost)
+    way = [0] * (n + 1)
+    minv = [float('inf')] * (n + 1)
+    used = [False] * (n + 1)
+    p[0] = row
+    j0 = 0
+    while True:
+        used[j0] = True
+        i0 = p[j0]
+        cost_row = cost[i0 - 1]
+        delta, j1 = float('inf'), 0
+        for j in range(1, n + 1):
+            if not used[j]:
+                reduced = cost_row[j - 1] - u[i0] - v[j]
+                if reduced < minv[j]:
+                    minv[j], way[j] = reduced, j0
+                if minv[j] < delta:
+                    delta, j1 = minv[j], j
+        for j in range(n + 1):
+            if used[j]:
+                u[p[j]] += delta
+                v[j] -= delta
+            else:
+                minv[j] -= delta
+        j0 = j1
+        if p[j0] == 0:
+            break
+    # Flip the assignments along the augmenting path
+    while j0:
+        j1 = way[j0]
+        p[j0] = p[j1]
+        j0 = j1
+
+def min_cost_assignment(cost) -> tuple[list,list,list]:
+    """
+    Solve the assignment problem of a square cost matrix from scratch.
+    :param cost: square cost matrix (list of lists).
+    :return: the potentials u, v and the assignment p (see assign_row).
+    """
+    n = len(cost)
+    u, v, p = [0] * (n + 1), [0] * (n + 1), [0] * (n + 1)
+    for row in range(1, n + 1):
+        assign_row(cost, row, u, v, p)
+    return u, v, p
+
+def window_symmetries() -> list[list[int]]:
+    """
+    :return: the 8 index permutations of a 3x3 window read row by row
+        (4 rotations, with and without a reflection). Permutation q maps a
+        pattern string to ''.join(pattern[i] for i in q).
+    """
+    permutations = []
+    for reflect in (False, True):
+        cells = [(row, 2 - col if reflect else col) for row in range(3) for col in range(3)]
+        for _ in range(4):
+            permutations.append([3 * row + col for row, col in cells])
+            cells = [(col, 2 - row) for row, col in cells]
+    return permutations
+
+class DeadlockPatternStore:
+    """
+    Database of local deadlock patterns, learned while solving and
+    optionally persisted to a JSON file so that later solves reuse them.
+
+    A pattern is the 3x3 window around a pushed box, read row by row as a
+    string of the characters '#' (wall), '$' (box), '*' (box on a target),
+    '.' (target) and ' ' (floor). It is a deadlock if the boxes of the window
+    can never all be put on targets, proven by a bounded search of a
+    relaxation where everything outside the window is removed: the window is
+    surrounded by a ring of free floor, the worker may start in any free
+    region, and a box pushed out of the window onto the ring counts as solved.
+    Every real solution maps to a solution of the relaxation, so a deadlock
+    of the relaxation is a deadlock of the warehouse.
+
+    The 8 rotations and reflections of a pattern are the same pattern, and
+    all of them are stored so that a lookup is a single set membership test.
+    A pattern whose proof was cut by search_limit is undecided: it is not a
+    deadlock for now, and is proven again once search_limit is raised.
+    Only the deadlocks are persisted, one pattern per symmetry class.
+    """
+    SYMMETRIES = window_symmetries()
+
+    def __init__(self, path: str = None, search_limit: int = 2000):
+        """
+        :param path: JSON file of the patterns, loaded if it exists (None for a store in memory only).
+        :param search_limit: maximum number of states of the search proving a pattern.
+        """
+        self.path = path
+        self.search_limit = search_limit
+        self.deadlocks = set()  # every orientation of the deadlock patterns
+        self.safe = set()  # every orientation of the patterns proven not to be deadlocks
+        self.undecided = {}  # every orientation of the other patterns -> search_limit of their proof
+        self.learned = 0  # number of deadlock patterns proven since the last save
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def orientations(self, pattern: str) -> set:
+        """
+        :param pattern: a 3x3 pattern string.
+        :return: the set of the rotations and reflections of the pattern.
+        """
+        return {''.join(pattern[i] for i in permutation) for permutation in self.SYMMETRIES}
+
+    def load(self):
+        """ Add the deadlock patterns of the JSON file to the store. """
+        with open(self.path) as f:
+            for pattern in json.load(f)['deadlocks']:
+                self.deadlocks |= self.orientations(pattern)
+
+    def save(self):
+        """ Write the deadlock patterns to the JSON file, one per symmetry class. """
+        canonical = sorted({min(self.orientations(pattern)) for pattern in self.deadlocks})
+        # Write to a temporary file first so that an interrupted save keeps the old file
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'deadlocks': canonical}, f, indent=0)
+        os.replace(temp_path, self.path)
+        self.learned = 0
+
+    def window(self, walls, targets, boxes, centre: tuple[int,int]) -> str:
+        """
+        Read the 3x3 pattern around a cell.
+        :param walls: set of wall positions.
+        :param targets: set of target positions.
+        :param boxes: collection of box positions.
+        :param centre: position (x,y) of the centre of the window.
+        :return: the pattern string.
+        """
+        x, y = centre
+        pattern = []
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                cell = (x + dx, y + dy)
+                if cell in walls:
+                    pattern.append('#')
+                elif cell in boxes:
+                    pattern.append('*' if cell in targets else '$')
+                else:
+                    pattern.append('.' if cell in targets else ' ')
+        return ''.join(pattern)
 
-    # Return the weights string followed by the warehouse string
-    return weights_str + "\n" + warehouse_string
+    def is_deadlock(self, pattern: str) -> bool:
+        """
+        Look up a pattern, proving it on the first lookup.
+        :param pattern: a 3x3 pattern string.
+        :return: True if the pattern is a deadlock.
+        """
+        if pattern in self.deadlocks:
+            self.hits += 1
+            return True
+        if pattern in self.safe or self.undecided.get(pattern, -1) >= self.search_limit:
+            self.hits += 1
+            return False
+        self.misses += 1
+        deadlock = self.prove(pattern)
+        if deadlock is None:
+            # Not a deadlock until a larger search limit proves it
+            self.undecided.update(dict.fromkeys(self.orientations(pattern), self.search_limit))
+            return False
+        for orientation in self.orientations(pattern):
+            self.undecided.pop(orientation, None)
+        if deadlock:
+            self.deadlocks |= self.orientations(pattern)
+            self.learned += 1
+        else:
+            self.safe |= self.orientations(pattern)
+        return deadlock
+
+    def prove(self, pattern: str) -> bool:
+        """
+        Search the relaxation of a pattern (see the class docstring).
+        :param pattern: a 3x3 pattern string.
+        :return: True if the boxes of the pattern can never all be put on
+            targets, False if they can, None if the search was cut by search_limit.
+        """
+        # 5x5 grid: the window in the middle, surrounded by the free ring
+        walls, targets, boxes = set(), set(), set()
+        for i, c in enumerate(pattern):
+            cell = (i % 3 + 1, i // 3 + 1)
+            if c == '#':
+                walls.add(cell)
+            if c in '*.':
+                targets.add(cell)
+            if c in '$*':
+                boxes.add(cell)
+        if boxes <= targets:
+            return False
+        grid = [(x, y) for x in range(5) for y in range(5) if (x, y) not in walls]
+        ring = {(x, y) for x, y in grid if x in (0, 4) or y in (0, 4)}
+
+        def flood(boxes, start):
+            region = {start}
+            frontier = [start]
+            while frontier:
+                x, y = frontier.pop()
+                for dx, dy in deltas.values():
+                    cell = (x + dx, y + dy)
+                    if 0 <= cell[0] < 5 and 0 <= cell[1] < 5 and cell not in walls and \
+                       cell not in boxes and cell not in region:
+                        region.add(cell)
+                        frontier.append(cell)
+            return frozenset(region)
+
+        # The worker may start in any free region
+        boxes = frozenset(boxes)
+        frontier = []
+        explored = set()
+        for cell in grid:
+            if cell not in boxes and not any(cell in region for _, region in frontier):
+                frontier.append((boxes, flood(boxes, cell)))
+                explored.add((boxes, min(frontier[-1][1])))
+
+        while frontier:
+            if len(explored) > self.search_limit:
+                return None
+            boxes, region = frontier.pop()
+            if boxes <= targets:
+                return False
+            for box_x, box_y in boxes:
+                for dx, dy in deltas.values():
+                    next_box_pos = (box_x + dx, box_y + dy)
+                    if (box_x - dx, box_y - dy) not in region or \
+                       next_box_pos in walls or next_box_pos in boxes:
+                        continue
+                    # The box left the window
+                    if next_box_pos in ring:
+                        return False
+                    next_boxes = boxes - {(box_x, box_y)} | {next_box_pos}
+                    next_region = flood(next_boxes, (box_x, box_y))
+                    key = (next_boxes, min(next_region))
+                    if key not in explored:
+                        explored.add(key)
+                        frontier.append((next_boxes, next_region))
+        return True
+
+# A state of the SokobanPuzzle.
+#   worker: (x,y) position of the worker.
+#   boxes: tuple of (x,y) box positions. The box at index i has the weight
+#          SokobanPuzzle.weights[i]. Boxes of equal weight are interchangeable,
+#          so their positions are kept sorted to give a single state per layout.
+# The walls, targets and taboo cells never change and are stored once
+# on the SokobanPuzzle instance.
+SokobanState = collections.namedtuple('SokobanState', ['worker', 'boxes'])
 
 class SokobanPuzzle(search.Problem):
     """
@@ -384,72 +724,327 @@ class SokobanPuzzle(search.Problem):
     """
     def __init__(self, warehouse: sokoban.Warehouse):
         """
-        Reads a warehouse text file and creates a SokobanPuzzle instance,
-        which captures the initial state of the warehouse
-        & other information about the warehouse stored as a Warehouse object
-        (e.g. worker position, boxes' positions, weights, wall positions).
+        Creates a SokobanPuzzle instance from a Warehouse object.
+        The static parts of the warehouse (walls, targets, taboo cells and weights)
+        are stored on the instance, and the initial state is a SokobanState.
         :param warehouse: a Warehouse object representing the initial state of the warehouse.
         """
-        # Store the initial state as a string
-        warehouse_string = warehouse.__str__()
-        # Store the initial state as a string with weights information added at the front
-        warehouse_string = warehouse.__str__()
-        # Convert weights list to a space-separated string
-        weights_str = " ".join(str(w) for w in warehouse.weights)
-        # Intial state looks like a txt document -> states are unpacked using the from_lines method
-        self.initial = weights_str + "\n" + warehouse_string
-        # Keep a reference to the original warehouse object for properties like walls, targets, weights
-        self.warehouse_obj = warehouse 
-        # Ensure tabooCells and walls are stored efficiently (as sets)
-        self.tabooCells = set(find_taboo_cells(warehouse))  
-        self.walls = set(warehouse.walls) # Store walls as a set for faster lookups
-    
-    def actions(self, state: str) -> list[str]:
+        # Keep a reference to the original warehouse object for rendering states
+        self.warehouse_obj = warehouse
+        # Ensure tabooCells, walls and targets are stored efficiently (as sets).
+        # Boxes are never pushed onto a dead square, which covers the taboo cells
+        self.tabooCells = set(find_taboo_cells(warehouse)) | set(dead_squares(warehouse))
+        self.walls = set(warehouse.walls)
+        self.targets = set(warehouse.targets)
+
+        # Order the boxes by weight so that boxes of equal weight are contiguous
+        order = sorted(range(len(warehouse.boxes)), key=lambda i: warehouse.weights[i])
+        self.weights = tuple(warehouse.weights[i] for i in order)
+
+        # box_groups[i] is the (start, end) slice of the boxes with the same weight as box i
+        self.box_groups = []
+        start = 0
+        for i in range(1, len(self.weights) + 1):
+            if i == len(self.weights) or self.weights[i] != self.weights[start]:
+                self.box_groups += [(start, i)] * (i - start)
+                start = i
+
+        boxes = [warehouse.boxes[i] for i in order]
+        for start, end in set(self.box_groups):
+            boxes[start:end] = sorted(boxes[start:end])
+        self.initial = SokobanState(warehouse.worker, tuple(boxes))
+
+        # Wall-aware push distances from every cell to every target, and from
+        # every cell to its nearest target (cells missing from the dictionary
+        # cannot reach any target)
+        self.target_list = list(warehouse.targets)
+        self.push_distances = push_distance_tables(self.walls, self.target_list,
+                                                   warehouse.nrows, warehouse.ncols)
+        nearest = self.push_distances.min(axis=0) if self.target_list else \
+            np.full((warehouse.nrows, warehouse.ncols), np.inf)
+        self.nearest_push_distance = {(x, y): int(nearest[y, x])
+                                      for y, x in zip(*np.nonzero(np.isfinite(nearest)))}
+        # Push distances to every target, with INFEASIBLE_COST for the unreachable ones
+        finite_distances = np.where(np.isfinite(self.push_distances), self.push_distances, INFEASIBLE_COST)
+        self.target_push_distances = {(x, y): [int(d) for d in finite_distances[:, y, x]]
+                                      for y, x in zip(*np.nonzero(np.isfinite(nearest)))}
+        # Indices of the targets a box can be pushed to from every cell
+        self.reachable_targets = {cell: [t for t, d in enumerate(distances) if d < INFEASIBLE_COST]
+                                  for cell, distances in self.target_push_distances.items()}
+
+        # Box-target matchings of the matching heuristic:
+        # state.boxes -> (row boxes, row weights, cost matrix, u, v, p)
+        self.matching_threshold = 4
+        self.matching_cache = collections.OrderedDict()
+        self.matching_cache_size = 10000
+
+        # Dynamic deadlock detection: freeze_check prunes the pushes that
+        # freeze boxes off target, and pruned counts the pruned states per rule
+        self.freeze_check = True
+        self.pruned = collections.Counter()
+        # matching_check prunes the pushes after which the boxes cannot be
+        # assigned to distinct reachable targets. The assignments found are
+        # cached by box configuration: boxes -> {box: target index}
+        self.matching_check = False
+        self.box_matchings = collections.OrderedDict()
+        # Optional DeadlockPatternStore: the pushes that make a deadlock
+        # pattern around the pushed box are pruned
+        self.pattern_store = None
+
+    def to_warehouse(self, state: SokobanState) -> sokoban.Warehouse:
+        """
+        Render a state as a Warehouse object (e.g. to print it or display it in the GUI).
+        :param state: a given state of the warehouse.
+        :return: a copy of the original warehouse with the worker and boxes of the state.
+        """
+        return self.warehouse_obj.copy(worker=state.worker,
+                                       boxes=list(state.boxes),
+                                       weights=list(self.weights))
+
+    def weighted_boxes(self, state: SokobanState) -> list[tuple[tuple[int,int],int]]:
+        """
+        List the boxes of a state with their weights.
+        :param state: a given state of the warehouse.
+        :return: a list of ((x,y), weight) pairs, one per box.
+        """
+        return list(zip(state.boxes, self.weights))
+
+    def move_box(self, boxes: tuple, i: int, new_pos: tuple[int,int]) -> tuple:
+        """
+        Move the box at index i to a new position, keeping the positions of
+        the boxes with the same weight sorted.
+        :param boxes: the box positions of a state.
+        :param i: index of the box that is pushed.
+        :param new_pos: the new position (x,y) of the box.
+        :return: the box positions of the resulting state.
+        """
+        start, end = self.box_groups[i]
+        if end - start == 1:
+            return boxes[:i] + (new_pos,) + boxes[i + 1:]
+        group = sorted(boxes[start:i] + (new_pos,) + boxes[i + 1:end])
+        return boxes[:start] + tuple(group) + boxes[end:]
+
+    def is_blocked(self, box: tuple[int,int], boxes, stuck: list, axis: tuple[int,int]) -> bool:
+        """
+        Check if a box can never be pushed along an axis, considering the
+        boxes in stuck as walls.
+        :param box: position (x,y) of the box.
+        :param boxes: collection of the box positions.
+        :param stuck: list of the boxes assumed to be frozen (see is_frozen).
+        :param axis: (1, 0) for the horizontal axis, (0, 1) for the vertical axis.
+        :return: True if the box is blocked along the axis.
+        """
+        dx, dy = axis
+        sides = ((box[0] - dx, box[1] - dy), (box[0] + dx, box[1] + dy))
+        # A wall on either side: the worker cannot stand on it and the box cannot move into it
+        if any(side in self.walls or side in stuck for side in sides):
+            return True
+        # Taboo cells on both sides: the box cannot be pushed onto either of them
+        if all(side in self.tabooCells for side in sides):
+            return True
+        # A box on either side that is frozen itself
+        return any(side in boxes and self.is_frozen(side, boxes, stuck) for side in sides)
+
+    def is_frozen(self, box: tuple[int,int], boxes, stuck: list) -> bool:
+        """
+        Check if a box can never be pushed again, i.e. it is blocked along
+        both axes. The box is added to stuck while its neighbours are checked,
+        so that boxes blocking each other are all frozen.
+        :param box: position (x,y) of the box.
+        :param boxes: collection of the box positions.
+        :param stuck: list of the boxes assumed to be frozen. On success the
+            box and the boxes freezing it are left in the list, on failure
+            the list is restored.
+        :return: True if the box is frozen.
+        """
+        depth = len(stuck)
+        stuck.append(box)
+        if self.is_blocked(box, boxes, stuck, (1, 0)) and self.is_blocked(box, boxes, stuck, (0, 1)):
+            return True
+        del stuck[depth:]
+        return False
+
+    def freeze_deadlock(self, boxes, box: tuple[int,int]) -> bool:
+        """
+        Check if a push froze boxes off target. Such a state can never
+        reach the goal.
+        :param boxes: collection of the box positions after the push.
+        :param box: position (x,y) of the pushed box.
+        :return: True if the pushed box is frozen together with a box that is not on a target.
+        """
+        stuck = []
+        return self.is_frozen(box, boxes, stuck) and \
+            any(frozen not in self.targets for frozen in stuck)
+
+    def augment(self, box: tuple[int,int], match: dict, owner: dict, visited: set) -> bool:
+        """
+        Look for an augmenting path from an unassigned box (Kuhn's algorithm)
+        and assign the box along it.
+        :param box: position (x,y) of the unassigned box.
+        :param match: dictionary box -> target index, updated in place.
+        :param owner: dictionary target index -> box, updated in place.
+        :param visited: set of the target indices already on the path.
+        :return: True if the box could be assigned.
+        """
+        for target in self.reachable_targets.get(box, ()):
+            if target not in visited:
+                visited.add(target)
+                if target not in owner or self.augment(owner[target], match, owner, visited):
+                    owner[target] = box
+                    match[box] = target
+                    return True
+        return False
+
+    def box_matching(self, key, boxes) -> dict:
+        """
+        Assign the boxes of a state to distinct targets they can be pushed to.
+        :param key: hashable box configuration of the state (state.boxes).
+        :param boxes: collection of the box positions of the state.
+        :return: a dictionary box -> target index, None if there is no such assignment.
+        """
+        if key in self.box_matchings:
+            self.box_matchings.move_to_end(key)
+            return self.box_matchings[key]
+        match, owner = {}, {}
+        for box in boxes:
+            if not self.augment(box, match, owner, set()):
+                match = None
+                break
+        self._store_matching(key, match)
+        return match
+
+    def _store_matching(self, key, match):
+        """ Cache the assignment of a box configuration, evicting the oldest one when full. """
+        self.box_matchings[key] = match
+        if len(self.box_matchings) > self.matching_cache_size:
+            self.box_matchings.popitem(last=False)
+
+    def matching_deadlock(self, match: dict, box: tuple[int,int], new_box: tuple[int,int], next_key) -> bool:
+        """
+        Check if a push leaves a box that cannot be assigned to a target.
+        The assignment of the state before the push is repaired: the pushed
+        box keeps its target if it can still reach it, otherwise a single
+        augmenting path is searched from it.
+        :param match: assignment of the state before the push (see box_matching).
+        :param box: position (x,y) of the pushed box before the push.
+        :param new_box: position (x,y) of the pushed box after the push.
+        :param next_key: box configuration after the push, the repaired assignment is cached under it.
+        :return: True if the boxes cannot be assigned to distinct targets after the push.
+        """
+        next_match = dict(match)
+        target = next_match.pop(box)
+        if target in self.reachable_targets.get(new_box, ()):
+            next_match[new_box] = target
+        else:
+            owner = {t: b for b, t in next_match.items()}
+            if not self.augment(new_box, next_match, owner, set()):
+                return True
+        self._store_matching(next_key, next_match)
+        return False
+
+    def pattern_deadlock(self, boxes, box: tuple[int,int]) -> bool:
+        """
+        Check the pattern around a pushed box in the pattern store.
+        :param boxes: collection of the box positions after the push.
+        :param box: position (x,y) of the pushed box.
+        :return: True if the pattern is a deadlock.
+        """
+        store = self.pattern_store
+        return store.is_deadlock(store.window(self.walls, self.targets, boxes, box))
+
+    def analyse(self) -> str:
+        """
+        Static analysis of the initial state, run before the search to
+        recognise the puzzles that can obviously not be solved.
+        The rules are checked from the cheapest to the most expensive:
+            'taboo': a box is off target on a taboo cell, or on a cell from
+                which it cannot be pushed to any target.
+            'unreachable_target': there are as many boxes as targets, and no
+                box can be pushed to one of the targets.
+            'matching': the boxes cannot be assigned to distinct targets they
+                can be pushed to.
+            'frozen': a box off target can never be pushed.
+        :return: the name of the first rule that applies, None if none does.
+        """
+        boxes = [box for box, _ in self.weighted_boxes(self.initial)]
+        if any(box not in self.targets and
+               (box in self.tabooCells or box not in self.reachable_targets) for box in boxes):
+            return 'taboo'
+
+        if len(boxes) == len(self.target_list):
+            reachable = set()
+            for box in boxes:
+                reachable.update(self.reachable_targets[box])
+            if len(reachable) < len(self.target_list):
+                return 'unreachable_target'
+
+        match, owner = {}, {}
+        if not all(self.augment(box, match, owner, set()) for box in boxes):
+            return 'matching'
+
+        box_set = set(boxes)
+        for box in boxes:
+            stuck = []
+            if box not in self.targets and self.is_frozen(box, box_set, stuck):
+                return 'frozen'
+        return None
+
+    def _push_is_legal(self, state: SokobanState, action: str) -> bool:
+        """
+        Check a push of the box next to the worker, with the same rules as
+        actions and successors.
+        The box has to be pushed onto a free cell that is not taboo.
+        Pushes into a freeze deadlock are pruned if freeze_check is set,
+        pushes making a deadlock pattern if pattern_store is set,
+        pushes leaving a box without a target if matching_check is set.
+        :param state: a given state of the warehouse, with a box next to the worker.
+        :param action: the direction of the push, e.g. 'Left', 'Down', 'Right', 'Up'.
+        :return: True if the push is legal and not pruned.
+        """
+        boxes = state.boxes
+        box = move_pos(state.worker, action)
+        next_box_pos = move_pos(box, action)
+        if next_box_pos in self.walls or \
+           next_box_pos in boxes or \
+           next_box_pos in self.tabooCells:
+            return False
+        next_boxes = self.move_box(boxes, boxes.index(box), next_box_pos)
+        if self.freeze_check and self.freeze_deadlock(next_boxes, next_box_pos):
+            self.pruned['freeze'] += 1
+            return False
+        if self.pattern_store is not None and self.pattern_deadlock(next_boxes, next_box_pos):
+            self.pruned['pattern'] += 1
+            return False
+        if self.matching_check:
+            # The assignment of the state is cached by box_matching
+            match = self.box_matching(boxes, boxes)
+            if match is not None and self.matching_deadlock(match, box, next_box_pos, next_boxes):
+                self.pruned['matching'] += 1
+                return False
+        return True
+
+    def actions(self, state: SokobanState) -> list[str]:
         """
         Gives the list of valid moves a worker can perform from a given state,
-        using the global deltas dictionary and checking taboo cells.
+        using the global deltas dictionary and the push rules of _push_is_legal.
         :param state: a given version of the warehouse.
         :return: a list of actions which can be performed in the given state.
         """
-        # Unpack the worker's position from the current state
-        current_warehouse = sokoban.Warehouse()
-        current_warehouse.from_lines(state.splitlines())
-        worker_x, worker_y = current_warehouse.worker
-
-        # Use object fields for efficiency
-        walls_set = self.walls
-        taboo_cells_set = self.tabooCells
-        box_positions = set(current_warehouse.boxes)
-
-        possible_actions = ['Up', 'Down', 'Left', 'Right']
+        worker_x, worker_y = state.worker
         valid_actions = []
 
-        for action in possible_actions:
-            # Calculate next positions using the global deltas dictionary
+        for action in ['Up', 'Down', 'Left', 'Right']:
             dx, dy = deltas[action]
             next_worker_pos = (worker_x + dx, worker_y + dy)
-
-            # Case 1: Move to an empty cell (not a wall, not a box)
-            if next_worker_pos not in walls_set and next_worker_pos not in box_positions:
-                valid_actions.append(action)
+            if next_worker_pos in self.walls:
                 continue
+            # Move to an empty cell, or into a box that can be pushed
+            if next_worker_pos not in state.boxes or self._push_is_legal(state, action):
+                valid_actions.append(action)
 
-            # Case 2: Move into a box, pushing it
-            if next_worker_pos in box_positions:
-                # Calculate where the box would end up using global deltas
-                next_box_pos = (next_worker_pos[0] + dx, next_worker_pos[1] + dy)
-                
-                # Check if the box's destination is valid:
-                # Neither a taboo cell nor another box.
-                # (Assuming taboo cells are never targets; adjust if needed)
-                if next_box_pos not in walls_set and \
-                   next_box_pos not in box_positions and \
-                   next_box_pos not in taboo_cells_set:
-                    valid_actions.append(action)
-        
         return valid_actions
 
-    def result(self, state: str, action: str) -> str:
+    def result(self, state: SokobanState, action: str) -> SokobanState:
         """
         Applies the given action to the given state and returns the resulting state.
         :param state: a given state of the warehouse.
@@ -457,18 +1052,50 @@ class SokobanPuzzle(search.Problem):
             E.g. 'Left', 'Down', 'Right', 'Up'.
         :return: a new state resulting from applying the action to the given state.
         """
+        new_worker_pos = move_pos(state.worker, action)
+        boxes = state.boxes
         # If the action is not valid, return the current state
-        if action not in self.actions(state):
+        if new_worker_pos in self.walls or \
+           (new_worker_pos in boxes and not self._push_is_legal(state, action)):
             return state
-        else:
-            warehouse = sokoban.Warehouse()
-            warehouse.from_lines(state.splitlines())
-            new_warehouse = move_warehouse(warehouse, action) 
-            new_warehouse_string = new_warehouse.__str__()
-            result_state = add_weights_to_string(new_warehouse, new_warehouse_string)
-            return result_state
 
-    def path_cost(self, c, state1: str, action: str, state2: str):
+        # Check if there's a box at the new worker position, if so push it
+        if new_worker_pos in boxes:
+            i = boxes.index(new_worker_pos)
+            boxes = self.move_box(boxes, i, move_pos(new_worker_pos, action))
+        return SokobanState(new_worker_pos, boxes)
+
+    def successors(self, state: SokobanState):
+        """
+        Generate the valid moves of a state together with their resulting
+        states and costs, in one pass (see search.Problem.successors).
+        The weight of a pushed box is charged when the push is generated.
+        The moves are the same as those of actions.
+        :param state: a given state of the warehouse.
+        :return: a generator of (action, next_state, step_cost) triples.
+        """
+        worker_x, worker_y = state.worker
+        boxes = state.boxes
+
+        for action in ['Up', 'Down', 'Left', 'Right']:
+            dx, dy = deltas[action]
+            next_worker_pos = (worker_x + dx, worker_y + dy)
+            if next_worker_pos in self.walls:
+                continue
+
+            # Move to an empty cell
+            if next_worker_pos not in boxes:
+                yield action, SokobanState(next_worker_pos, boxes), 1
+                continue
+
+            # Move into a box, pushing it
+            if not self._push_is_legal(state, action):
+                continue
+            i = boxes.index(next_worker_pos)
+            next_boxes = self.move_box(boxes, i, (next_worker_pos[0] + dx, next_worker_pos[1] + dy))
+            yield action, SokobanState(next_worker_pos, next_boxes), 1 + self.weights[i]
+
+    def path_cost(self, c, state1: SokobanState, action: str, state2: SokobanState):
         """
         Calculate the cost of a path from state 1 to state 2 via the given action, assuming cost c.
         :param c: cost to move to state 1.
@@ -478,79 +1105,1079 @@ class SokobanPuzzle(search.Problem):
         :return: total cost of path to state 2.
         """
         # Default cost for moving is 1
-
         move_cost = 1
 
-        # Unpack the states
-        current_warehouse = sokoban.Warehouse()
-        current_warehouse.from_lines(state1.splitlines())
-        new_warehouse = sokoban.Warehouse()
-        new_warehouse.from_lines(state2.splitlines())
-
-        # worker_pos1, box_positions1 = current_warehouse.worker, current_warehouse.boxes # Not needed?
-        box_positions1 = current_warehouse.boxes
-        # worker_pos2, box_positions2 = new_warehouse.worker, new_warehouse.boxes # Not needed?
-        box_positions2 = new_warehouse.boxes
-
-        # If the box positions are different, we pushed a box
-        if box_positions1 != box_positions2:
-            # Find which box was moved
-            for i, (box1, box2) in enumerate(zip(box_positions1, box_positions2)):
-                if box1 != box2:
-                    # This box was moved, add its weight to the cost
-                    # Use the weights from the original warehouse object
-                    move_cost += current_warehouse.weights[i] 
-                    break
+        # If the worker moved onto a box, that box was pushed: add its weight to the cost
+        if state2.worker in state1.boxes:
+            move_cost += self.weights[state1.boxes.index(state2.worker)]
 
         return c + move_cost
 
-    def value(self, state: str):
+    def value(self, state: SokobanState):
         """
         Compute the value of the given state.
         Used for optimization problems.
         :param state: current state.
         :return: value of the given state.
         """
-        # Unpack the state
-        current_warehouse = sokoban.Warehouse()
-        current_warehouse.from_lines(state.splitlines())
-        box_positions = current_warehouse.boxes
-
-        # For Sokoban, we can use the negative of the Manhattan distance
+        # For Sokoban, we can use the negative of the weighted push distance
         # from boxes to their nearest targets as a value function
+        return -self.push_distance_heuristic(search.Node(state))  # Negative because we want to maximize value
+
+    def manhattan_heuristic(self, node: search.Node):
+        """
+        Simple admissible heuristic: sum of the Manhattan distances from each
+        box to its nearest target. Ignores walls and weights.
+        :param node: a search node.
+        :return: the heuristic value of the node's state.
+        """
         total_distance = 0
-        for box in box_positions:
-            # Find the minimum Manhattan distance to any target
-            min_distance = float('inf')
-            # Use targets from the original warehouse object
-            for target in self.warehouse_obj.targets: 
+
+        if not self.targets: # Handle case with no targets
+            return 0
+
+        # Calculate the sum of minimum Manhattan distances for each box to any target
+        for box, _ in self.weighted_boxes(node.state):
+            min_distance_for_box = float('inf')
+            for target in self.targets:
                 distance = abs(box[0] - target[0]) + abs(box[1] - target[1])
-                min_distance = min(min_distance, distance)
-            total_distance += min_distance
+                min_distance_for_box = min(min_distance_for_box, distance)
+            total_distance += min_distance_for_box
 
-        return -total_distance  # Negative because we want to maximize value
+        return total_distance
 
-    def goal_test(self, state):
+    def push_distance_heuristic(self, node: search.Node):
+        """
+        Admissible heuristic: sum over the boxes of the number of pushes to
+        the box's nearest target (self.push_distances) times (1 + weight),
+        the cost of each push. Walking moves are not counted.
+        :param node: a search node.
+        :return: the heuristic value of the node's state,
+            inf if a box cannot be pushed to any target.
+        """
+        total_cost = 0
+        nearest_push_distance = self.nearest_push_distance
+        for box, weight in self.weighted_boxes(node.state):
+            if box not in nearest_push_distance:
+                return float('inf')
+            total_cost += (1 + weight) * nearest_push_distance[box]
+        return total_cost
+
+    def matching_heuristic(self, node: search.Node):
+        """
+        Admissible heuristic: cost of a minimum-cost assignment of the boxes
+        to distinct targets, where sending a box to a target costs
+        (1 + weight) * push distance. Stronger than push_distance_heuristic
+        because two boxes cannot claim the same target.
+        A push moves a single box, so only one row of the parent's cost matrix
+        changes: the parent's optimal assignment is repaired by unassigning
+        that row and adding it back with one Hungarian augmentation (O(n^2))
+        instead of solving from scratch (O(n^3)).
+        Below self.matching_threshold boxes the small assignment problem is
+        solved directly with scipy's linear_sum_assignment.
+        :param node: a search node.
+        :return: the heuristic value of the node's state,
+            inf if no assignment of the boxes to the targets is possible.
+        """
+        boxes = self.weighted_boxes(node.state)
+        target_push_distances = self.target_push_distances
+        for box, _ in boxes:
+            if box not in target_push_distances:
+                return float('inf')
+
+        if len(boxes) < self.matching_threshold:
+            cost = np.array([[(1 + weight) * d for d in target_push_distances[box]]
+                             for box, weight in boxes])
+            rows, columns = linear_sum_assignment(cost)
+            total_cost = cost[rows, columns].sum()
+            return float('inf') if total_cost >= INFEASIBLE_COST else int(total_cost)
+
+        parent = self.matching_cache.get(node.parent.state.boxes) if node.parent else None
+        moved = None
+        if parent is not None:
+            # Find the box that moved from the parent's state
+            old_boxes = set(parent[0]).difference(box for box, _ in boxes)
+            new_boxes = set(box for box, _ in boxes).difference(parent[0])
+            if len(old_boxes) == 1 and len(new_boxes) == 1:
+                moved = (old_boxes.pop(), new_boxes.pop())
+
+        if moved is None:
+            # Solve from scratch
+            row_boxes = [box for box, _ in boxes]
+            row_weights = [weight for _, weight in boxes]
+            cost = [[(1 + weight) * d for d in target_push_distances[box]] for box, weight in boxes]
+            u, v, p = min_cost_assignment(cost)
+        else:
+            # Repair the parent's assignment: only the row of the moved box changed
+            row_boxes, row_weights, cost, u, v, p = parent
+            row = row_boxes.index(moved[0])
+            row_boxes = row_boxes[:row] + [moved[1]] + row_boxes[row + 1:]
+            cost_row = [(1 + row_weights[row]) * d for d in target_push_distances[moved[1]]]
+            cost = cost[:row] + [cost_row] + cost[row + 1:]
+            u, v, p = list(u), list(v), list(p)
+            p[p.index(row + 1, 1)] = 0
+            # Lower the row potential so that the new row is feasible
+            u[row + 1] = min(c - v[j + 1] for j, c in enumerate(cost_row))
+            assign_row(cost, row + 1, u, v, p)
+
+        self.matching_cache[node.state.boxes] = (row_boxes, row_weights, cost, u, v, p)
+        if len(self.matching_cache) > self.matching_cache_size:
+            self.matching_cache.popitem(last=False)
+
+        total_cost = sum(cost[p[j] - 1][j - 1] for j in range(1, len(cost) + 1))
+        return float('inf') if total_cost >= INFEASIBLE_COST else total_cost
+
+    def goal_test(self, state: SokobanState):
         """
         Check if the current state is a goal state.
         A goal state is defined as a state where all boxes are on target cells.
-        :param state: current state of the warehouse (string representation).
+        :param state: current state of the warehouse.
         :return: True if the state is a goal state, False otherwise.
         """
-        # Unpack the state
-        current_warehouse = sokoban.Warehouse()
-        current_warehouse.from_lines(state.splitlines())
-        box_positions = current_warehouse.boxes
-
         # Check if all boxes are on target cells
-        # Use targets from the original warehouse object
-        target_set = set(self.warehouse_obj.targets) 
-        for box in box_positions:
+        target_set = self.targets
+        for box in state.boxes:
             if box not in target_set:
                 return False
 
         return True
 
+# A state of the BitboardSokobanPuzzle.
+#   worker: index y*ncols+x of the worker's cell.
+#   boxes: tuple of integer masks, one per distinct box weight
+#          (BitboardSokobanPuzzle.class_weights). Bit y*ncols+x of boxes[k]
+#          is set if a box of weight class_weights[k] is on cell (x,y).
+BitboardState = collections.namedtuple('BitboardState', ['worker', 'boxes'])
+
+class BitboardSokobanPuzzle(SokobanPuzzle):
+    """
+    A SokobanPuzzle where cells are bit indices y*ncols+x and the walls,
+    taboo cells, targets and boxes are arbitrary-precision integer masks.
+    Move and push legality, goal testing and state hashing are a few integer
+    operations instead of set lookups on (x,y) tuples.
+    Same actions, path costs and goal states as SokobanPuzzle.
+    """
+    def __init__(self, warehouse: sokoban.Warehouse):
+        """
+        Creates a BitboardSokobanPuzzle instance from a Warehouse object.
+        :param warehouse: a Warehouse object representing the initial state of the warehouse.
+        """
+        super().__init__(warehouse)
+        self.ncols = warehouse.ncols
+        self.wall_mask = self.to_mask(self.walls)
+        self.target_mask = self.to_mask(self.targets)
+        # A box can neither be pushed onto a wall nor onto a taboo cell
+        self.blocked_mask = self.wall_mask | self.to_mask(self.tabooCells)
+        # Index offset of each action
+        self.offsets = []
+        for action in ['Up', 'Down', 'Left', 'Right']:
+            dx, dy = deltas[action]
+            self.offsets.append((action, dx + dy * self.ncols))
+        self.action_offsets = dict(self.offsets)
+
+        # One mask per distinct weight: boxes of the same weight are interchangeable
+        self.class_weights = tuple(sorted(set(self.weights)))
+        box_masks = [0] * len(self.class_weights)
+        for box, weight in zip(self.initial.boxes, self.weights):
+            box_masks[self.class_weights.index(weight)] |= 1 << self.to_index(box)
+        self.initial = BitboardState(self.to_index(self.initial.worker), tuple(box_masks))
+
+    def to_index(self, pos: tuple[int,int]) -> int:
+        """
+        :param pos: a position (x,y).
+        :return: the bit index of the position.
+        """
+        return pos[1] * self.ncols + pos[0]
+
+    def to_pos(self, index: int) -> tuple[int,int]:
+        """
+        :param index: a bit index.
+        :return: the position (x,y) of the bit index.
+        """
+        return index % self.ncols, index // self.ncols
+
+    def to_mask(self, positions) -> int:
+        """
+        :param positions: an iterable of positions (x,y).
+        :return: the mask with the bits of the given positions set.
+        """
+        mask = 0
+        for pos in positions:
+            mask |= 1 << self.to_index(pos)
+        return mask
+
+    def positions(self, mask: int) -> set:
+        """
+        :param mask: an integer mask.
+        :return: the set of the positions (x,y) of the bits set in the mask.
+        """
+        positions = set()
+        while mask:
+            low_bit = mask & -mask
+            positions.add(self.to_pos(low_bit.bit_length() - 1))
+            mask ^= low_bit
+        return positions
+
+    def weighted_boxes(self, state: BitboardState) -> list[tuple[tuple[int,int],int]]:
+        """
+        List the boxes of a state with their weights.
+        :param state: a given state of the warehouse.
+        :return: a list of ((x,y), weight) pairs, one per box.
+        """
+        boxes = []
+        for mask, weight in zip(state.boxes, self.class_weights):
+            while mask:
+                low_bit = mask & -mask
+                boxes.append((self.to_pos(low_bit.bit_length() - 1), weight))
+                mask ^= low_bit
+        return boxes
+
+    def to_warehouse(self, state: BitboardState) -> sokoban.Warehouse:
+        """
+        Render a state as a Warehouse object.
+        :param state: a given state of the warehouse.
+        :return: a copy of the original warehouse with the worker and boxes of the state.
+        """
+        boxes = self.weighted_boxes(state)
+        return self.warehouse_obj.copy(worker=self.to_pos(state.worker),
+                                       boxes=[box for box, _ in boxes],
+                                       weights=[weight for _, weight in boxes])
+
+    def _push_is_legal(self, state: BitboardState, action: str) -> bool:
+        """
+        Check a push of the box next to the worker, with the same rules as
+        SokobanPuzzle._push_is_legal.
+        :param state: a given state of the warehouse, with a box next to the worker.
+        :param action: the direction of the push, e.g. 'Left', 'Down', 'Right', 'Up'.
+        :return: True if the push is legal and not pruned.
+        """
+        occupied = 0
+        for mask in state.boxes:
+            occupied |= mask
+        offset = self.action_offsets[action]
+        next_worker = state.worker + offset
+        next_box = next_worker + offset
+        # The box can only be pushed onto a free cell that is not taboo
+        if ((self.blocked_mask | occupied) >> next_box) & 1:
+            return False
+        worker_bit = 1 << next_worker
+        if self.freeze_check or self.pattern_store is not None:
+            next_boxes = self.positions(occupied ^ worker_bit ^ (1 << next_box))
+            if self.freeze_check and self.freeze_deadlock(next_boxes, self.to_pos(next_box)):
+                self.pruned['freeze'] += 1
+                return False
+            if self.pattern_store is not None and self.pattern_deadlock(next_boxes, self.to_pos(next_box)):
+                self.pruned['pattern'] += 1
+                return False
+        if self.matching_check:
+            # The assignment of the state is cached by box_matching
+            match = self.box_matching(state.boxes, self.positions(occupied))
+            if match is not None:
+                boxes = tuple(mask ^ worker_bit ^ (1 << next_box) if mask & worker_bit else mask
+                              for mask in state.boxes)
+                if self.matching_deadlock(match, self.to_pos(next_worker), self.to_pos(next_box), boxes):
+                    self.pruned['matching'] += 1
+                    return False
+        return True
+
+    def actions(self, state: BitboardState) -> list[str]:
+        """
+        Gives the list of valid moves a worker can perform from a given state.
+        :param state: a given version of the warehouse.
+        :return: a list of actions which can be performed in the given state.
+        """
+        occupied = 0
+        for mask in state.boxes:
+            occupied |= mask
+
+        valid_actions = []
+        for action, offset in self.offsets:
+            next_worker = state.worker + offset
+            # The worker cannot walk into a wall
+            if (self.wall_mask >> next_worker) & 1:
+                continue
+            # Move to an empty cell, or into a box that can be pushed
+            if not (occupied >> next_worker) & 1 or self._push_is_legal(state, action):
+                valid_actions.append(action)
+
+        return valid_actions
+
+    def result(self, state: BitboardState, action: str) -> BitboardState:
+        """
+        Applies the given action to the given state and returns the resulting state.
+        :param state: a given state of the warehouse.
+        :param action: a movement performed by the worker.
+        :return: a new state resulting from applying the action to the given state.
+        """
+        next_worker = state.worker + self.action_offsets[action]
+        worker_bit = 1 << next_worker
+        boxes = state.boxes
+        # If the action is not valid, return the current state
+        if (self.wall_mask >> next_worker) & 1 or \
+           (any(mask & worker_bit for mask in boxes) and not self._push_is_legal(state, action)):
+            return state
+
+        for k, mask in enumerate(boxes):
+            if mask & worker_bit:
+                # Push the box: clear its bit and set the bit of the cell beyond it
+                pushed = mask ^ worker_bit ^ (1 << (2 * next_worker - state.worker))
+                boxes = boxes[:k] + (pushed,) + boxes[k + 1:]
+                break
+        return BitboardState(next_worker, boxes)
+
+    def successors(self, state: BitboardState):
+        """
+        Generate the valid moves of a state together with their resulting
+        states and costs, in one pass (see search.Problem.successors).
+        The moves are the same as those of actions.
+        :param state: a given state of the warehouse.
+        :return: a generator of (action, next_state, step_cost) triples.
+        """
+        occupied = 0
+        for mask in state.boxes:
+            occupied |= mask
+
+        for action, offset in self.offsets:
+            next_worker = state.worker + offset
+            if (self.wall_mask >> next_worker) & 1:
+                continue
+
+            worker_bit = 1 << next_worker
+            # Move to an empty cell
+            if not occupied & worker_bit:
+                yield action, BitboardState(next_worker, state.boxes), 1
+                continue
+
+            # Push the box
+            if not self._push_is_legal(state, action):
+                continue
+            next_box = next_worker + offset
+            for k, mask in enumerate(state.boxes):
+                if mask & worker_bit:
+                    boxes = state.boxes[:k] + (mask ^ worker_bit ^ (1 << next_box),) + state.boxes[k + 1:]
+                    yield action, BitboardState(next_worker, boxes), 1 + self.class_weights[k]
+                    break
+
+    def path_cost(self, c, state1: BitboardState, action: str, state2: BitboardState):
+        """
+        Calculate the cost of a path from state 1 to state 2 via the given action, assuming cost c.
+        :param c: cost to move to state 1.
+        :param state1: current state.
+        :param action: action of moving from state 1 to state 2.
+        :param state2: state resulting from applying the action.
+        :return: total cost of path to state 2.
+        """
+        worker_bit = 1 << state2.worker
+        for mask, weight in zip(state1.boxes, self.class_weights):
+            if mask & worker_bit:
+                # A box was pushed, add its weight to the cost
+                return c + 1 + weight
+        return c + 1
+
+    def goal_test(self, state: BitboardState):
+        """
+        Check if all boxes are on target cells.
+        :param state: current state of the warehouse.
+        :return: True if the state is a goal state, False otherwise.
+        """
+        for mask in state.boxes:
+            if mask & ~self.target_mask:
+                return False
+        return True
+
+def worker_distances(walls, boxes, start: tuple[int,int]) -> dict:
+    """
+    Flood fill the cells the worker can walk to without pushing a box.
+    :param walls: set of wall positions.
+    :param boxes: collection of box positions.
+    :param start: position (x,y) of the worker.
+    :return: dictionary mapping each reachable cell (x,y) to its walking distance from start.
+    """
+    distances = {start: 0}
+    frontier = collections.deque([start])
+    while frontier:
+        x, y = frontier.popleft()
+        distance = distances[(x, y)] + 1
+        for dx, dy in deltas.values():
+            next_pos = (x + dx, y + dy)
+            if next_pos not in distances and next_pos not in walls and next_pos not in boxes:
+                distances[next_pos] = distance
+                frontier.append(next_pos)
+    return distances
+
+def worker_path(walls, boxes, start: tuple[int,int], goal: tuple[int,int]) -> list[str]:
+    """
+    Find a shortest walk of the worker that does not push any box.
+    :param walls: set of wall positions.
+    :param boxes: collection of box positions.
+    :param start: position (x,y) of the worker.
+    :param goal: position (x,y) the worker has to reach.
+    :return: the list of actions of the walk, or None if goal is not reachable.
+    """
+    came_from = {start: None}  # cell -> (previous cell, action)
+    frontier = collections.deque([start])
+    while frontier and goal not in came_from:
+        x, y = frontier.popleft()
+        for action, (dx, dy) in deltas.items():
+            next_pos = (x + dx, y + dy)
+            if next_pos not in came_from and next_pos not in walls and next_pos not in boxes:
+                came_from[next_pos] = ((x, y), action)
+                frontier.append(next_pos)
+    if goal not in came_from:
+        return None
+
+    path = []
+    pos = goal
+    while came_from[pos] is not None:
+        pos, action = came_from[pos]
+        path.append(action)
+    return path[::-1]
+
+class ReachabilityCache:
+    """
+    Worker reachability for box configurations, cached in bounded LRU caches.
+
+    For a set of box positions, the free floor cells split into connected
+    components: the regions the worker can walk around in. Each component is
+    labelled by its smallest cell, which is also a normalised worker position.
+    The components depend only on the box positions, so they are cached by
+    box configuration and shared by all the worker positions. After a single
+    push, the components of the new configuration are derived from those of
+    the previous one. Only the region the box was pushed into and the regions
+    around the cell it left are flood filled again.
+    The walking distances are cached by (box configuration, worker) pair.
+    """
+    def __init__(self, walls, floor, maxsize: int = 5000):
+        """
+        :param walls: set of wall positions.
+        :param floor: set of the non-wall cells inside the warehouse.
+        :param maxsize: maximum number of entries of each cache.
+        """
+        self.maxsize = maxsize
+        # Adjacent floor cells of every floor cell
+        self.neighbours = {}
+        for x, y in floor:
+            self.neighbours[(x, y)] = [(x + dx, y + dy) for dx, dy in deltas.values()
+                                       if (x + dx, y + dy) in floor and (x + dx, y + dy) not in walls]
+        self.component_cache = collections.OrderedDict()  # frozenset(boxes) -> (labels, members)
+        self.hits = 0
+        self.misses = 0
+        self.incremental_updates = 0
+        self.distance_cache = collections.OrderedDict()  # (boxes, worker) -> distances
+        self.distance_hits = 0
+        self.distance_misses = 0
+
+    def _lookup(self, boxes):
+        """ Return the cached components of boxes (or None) and count the hit or miss. """
+        value = self.component_cache.get(boxes)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.component_cache.move_to_end(boxes)
+        return value
+
+    def _store(self, boxes, value):
+        """ Cache components, evicting the least recently used entry when full. """
+        self.component_cache[boxes] = value
+        if len(self.component_cache) > self.maxsize:
+            self.component_cache.popitem(last=False)
+
+    def _flood(self, start, boxes, labels, members, allowed=None):
+        """
+        Label the component of the free cell 'start'.
+        :param boxes: set of box positions.
+        :param labels: dictionary cell -> label, updated in place.
+        :param members: dictionary label -> frozenset of cells, updated in place.
+        :param allowed: if not None, the set of cells the component is restricted to.
+        """
+        cells = {start}
+        frontier = [start]
+        while frontier:
+            cell = frontier.pop()
+            for next_cell in self.neighbours[cell]:
+                if next_cell not in cells and next_cell not in boxes and \
+                   (allowed is None or next_cell in allowed):
+                    cells.add(next_cell)
+                    frontier.append(next_cell)
+        label = min(cells)
+        for cell in cells:
+            labels[cell] = label
+        members[label] = frozenset(cells)
+
+    def flood(self, boxes, start: tuple[int,int]) -> set:
+        """
+        Uncached flood fill, for box configurations that are not worth caching.
+        :param boxes: collection of box positions.
+        :param start: position of the worker.
+        :return: the set of cells the worker can walk to.
+        """
+        cells = {start}
+        frontier = [start]
+        while frontier:
+            for next_cell in self.neighbours[frontier.pop()]:
+                if next_cell not in cells and next_cell not in boxes:
+                    cells.add(next_cell)
+                    frontier.append(next_cell)
+        return cells
+
+    def components(self, boxes: frozenset) -> tuple[dict,dict]:
+        """
+        :param boxes: frozenset of box positions.
+        :return: (labels, members) where labels maps each free floor cell to
+            the label of its component and members maps each label to the
+            frozenset of cells of the component.
+        """
+        value = self._lookup(boxes)
+        if value is None:
+            labels, members = {}, {}
+            for cell in self.neighbours:
+                if cell not in boxes and cell not in labels:
+                    self._flood(cell, boxes, labels, members)
+            value = (labels, members)
+            self._store(boxes, value)
+        return value
+
+    def components_after_push(self, boxes: frozenset, box: tuple[int,int],
+                              new_box: tuple[int,int]) -> tuple[dict,dict]:
+        """
+        Components of the box configuration obtained by pushing one box.
+        Derived from the components of 'boxes' if they are cached.
+        :param boxes: frozenset of box positions before the push.
+        :param box: position of the pushed box before the push.
+        :param new_box: position of the pushed box after the push.
+        :return: (labels, members) of the new configuration (see components).
+        """
+        new_boxes = boxes - {box} | {new_box}
+        if new_boxes in self.component_cache or boxes not in self.component_cache:
+            return self.components(new_boxes)
+
+        self.incremental_updates += 1
+        labels, members = self.component_cache[boxes]
+        labels, members = dict(labels), dict(members)
+        # The cell the box is pushed onto leaves its component, which may split
+        affected = set(members.pop(labels[new_box]))
+        # The cell the box leaves joins the components around it
+        affected.add(box)
+        for cell in self.neighbours[box]:
+            if cell in labels and labels[cell] in members:
+                affected |= members.pop(labels[cell])
+        for cell in affected:
+            labels.pop(cell, None)
+        affected.discard(new_box)
+        for cell in affected:
+            if cell not in labels:
+                self._flood(cell, new_boxes, labels, members, affected)
+
+        self.misses += 1
+        value = (labels, members)
+        self._store(new_boxes, value)
+        return value
+
+    def distances(self, boxes: frozenset, worker: tuple[int,int]) -> dict:
+        """
+        :param boxes: frozenset of box positions.
+        :param worker: position of the worker.
+        :return: dictionary mapping each cell the worker can walk to
+            to its walking distance.
+        """
+        key = (boxes, worker)
+        distances = self.distance_cache.get(key)
+        if distances is not None:
+            self.distance_hits += 1
+            self.distance_cache.move_to_end(key)
+            return distances
+        self.distance_misses += 1
+        distances = {worker: 0}
+        frontier = collections.deque([worker])
+        while frontier:
+            cell = frontier.popleft()
+            distance = distances[cell] + 1
+            for next_cell in self.neighbours[cell]:
+                if next_cell not in distances and next_cell not in boxes:
+                    distances[next_cell] = distance
+                    frontier.append(next_cell)
+        self.distance_cache[key] = distances
+        if len(self.distance_cache) > self.maxsize:
+            self.distance_cache.popitem(last=False)
+        return distances
+
+    def stats(self) -> dict:
+        """
+        :return: dictionary of the hit and miss counts of the component and
+            distance caches, and the number of incremental component updates.
+        """
+        return {'component_hits': self.hits,
+                'component_misses': self.misses,
+                'incremental_updates': self.incremental_updates,
+                'distance_hits': self.distance_hits,
+                'distance_misses': self.distance_misses}
+
+class SokobanPushPuzzle(SokobanPuzzle):
+    """
+    A SokobanPuzzle searched at the level of box pushes.
+    An action is a push (box, direction): the worker walks to the cell behind
+    the box without pushing anything, then pushes the box one cell in that
+    direction. Its cost is the length of the walk plus 1 plus the weight of
+    the box, so a least-cost push plan is a least-cost plan of SokobanPuzzle.
+    The states are SokobanStates where the worker stands where the last
+    pushed box was (or at its initial position).
+    The walking moves are never put in the frontier, which removes most of
+    the states of SokobanPuzzle.
+    Flood fills of the worker's region go through a ReachabilityCache.
+
+    The regions the worker cannot reach (corrals) can also be used to cut
+    the search. A PI-corral is a corral such that the worker can only push
+    the boxes around it into it.
+    - If corral_check is set, a PI-corral whose boxes cannot be put on
+      targets even when all the other boxes are removed is a deadlock, and
+      the state has no successors. Only unsolvable states are cut, so the
+      plans found are still least-cost.
+    - If pi_corral_check is set, only the pushes of the boxes around a
+      PI-corral are generated. Pushing into a PI-corral first is safe for
+      the number of pushes but not for the number of moves or the weights,
+      so this can lose optimality.
+    """
+    def __init__(self, warehouse: sokoban.Warehouse, cache_size: int = 5000):
+        """
+        :param warehouse: a Warehouse object representing the initial state of the warehouse.
+        :param cache_size: maximum number of entries of each reachability cache.
+        """
+        super().__init__(warehouse)
+        floor = worker_distances(self.walls, (), warehouse.worker)
+        self.reachability = ReachabilityCache(self.walls, floor, cache_size)
+
+        # Corral pruning (off by default, see the class docstring):
+        # the sub-searches proving corral deadlocks expand at most
+        # corral_search_limit states, and their results are cached by
+        # (corral boxes, normalised worker position)
+        self.corral_check = False
+        self.pi_corral_check = False
+        self.corral_search_limit = 200
+        self.corral_cache = collections.OrderedDict()
+        self.corral_cache_size = cache_size
+
+    def reachable(self, state: SokobanState) -> dict:
+        """
+        The distances are cached by the ReachabilityCache, so that actions
+        and the path_cost of each push of a state share one flood fill.
+        :param state: a given state of the warehouse.
+        :return: dictionary mapping each cell the worker can walk to
+            to its walking distance.
+        """
+        return self.reachability.distances(frozenset(state.boxes), state.worker)
+
+    def corrals(self, state: SokobanState) -> list[tuple[frozenset,set]]:
+        """
+        Find the corrals of a state that still have work to do: the regions
+        the worker cannot reach, with a box off target around them or an
+        empty target inside them.
+        :param state: a given state of the warehouse.
+        :return: a list of (cells, boxes) pairs, where cells is the frozenset
+            of cells of a corral and boxes the set of boxes next to it.
+        """
+        labels, members = self.reachability.components(frozenset(state.boxes))
+        worker_label = labels[state.worker]
+        corral_boxes = collections.defaultdict(set)  # label -> boxes next to the corral
+        for box in state.boxes:
+            for cell in self.reachability.neighbours[box]:
+                label = labels.get(cell)
+                if label is not None and label != worker_label:
+                    corral_boxes[label].add(box)
+
+        corrals = []
+        for label, boxes in corral_boxes.items():
+            cells = members[label]
+            if any(box not in self.targets for box in boxes) or \
+               any(cell in self.targets for cell in cells):
+                corrals.append((cells, boxes))
+        return corrals
+
+    def is_pi_corral(self, state: SokobanState, distances: dict, cells: frozenset, boxes: set) -> bool:
+        """
+        Check if a corral is a PI-corral: it has a barrier of boxes next to
+        the worker's region, and every barrier box can be pushed by the
+        worker, but only into the corral.
+        :param state: a given state of the warehouse.
+        :param distances: walking distances of the worker in the state.
+        :param cells: the cells of the corral.
+        :param boxes: the boxes next to the corral.
+        :return: True if the corral is a PI-corral.
+        """
+        barrier = False
+        for box_x, box_y in boxes:
+            pushable = False
+            for dx, dy in deltas.values():
+                if (box_x - dx, box_y - dy) not in distances:
+                    continue
+                next_box_pos = (box_x + dx, box_y + dy)
+                if next_box_pos in self.walls or next_box_pos in state.boxes or \
+                   next_box_pos in self.tabooCells:
+                    continue
+                # A legal push out of the corral
+                if next_box_pos not in cells:
+                    return False
+                pushable = True
+            if any(cell in distances for cell in self.reachability.neighbours[(box_x, box_y)]):
+                # A barrier box the worker cannot push into the corral
+                if not pushable:
+                    return False
+                barrier = True
+        return barrier
+
+    def corral_deadlock(self, state: SokobanState, cells: frozenset, boxes: set) -> bool:
+        """
+        Check if the boxes of a corral can never all be put on targets,
+        by a bounded search of the pushes of these boxes alone (the other
+        boxes are removed, which can only make the puzzle easier).
+        The search gives up as soon as the worker gets into the corral.
+        :param state: a given state of the warehouse.
+        :param cells: the cells of the corral.
+        :param boxes: the boxes next to the corral.
+        :return: True if the corral is proven to be a deadlock, False if it
+            is not or if the search gave up.
+        """
+        boxes = frozenset(boxes)
+        region = self.reachability.flood(boxes, state.worker)
+        key = (boxes, min(region))
+        deadlock = self.corral_cache.get(key)
+        if deadlock is not None:
+            self.corral_cache.move_to_end(key)
+            return deadlock
+
+        deadlock = True
+        explored = {key}
+        frontier = [(boxes, region)]
+        while frontier and deadlock:
+            if len(explored) > self.corral_search_limit:
+                deadlock = False
+                break
+            boxes, region = frontier.pop()
+            if all(box in self.targets for box in boxes) or not region.isdisjoint(cells):
+                deadlock = False
+                break
+            for box_x, box_y in boxes:
+                for dx, dy in deltas.values():
+                    next_box_pos = (box_x + dx, box_y + dy)
+                    if (box_x - dx, box_y - dy) not in region or next_box_pos in self.walls or \
+                       next_box_pos in boxes or next_box_pos in self.tabooCells:
+                        continue
+                    next_boxes = boxes - {(box_x, box_y)} | {next_box_pos}
+                    if self.freeze_check and self.freeze_deadlock(next_boxes, next_box_pos):
+                        continue
+                    next_region = self.reachability.flood(next_boxes, (box_x, box_y))
+                    next_key = (next_boxes, min(next_region))
+                    if next_key not in explored:
+                        explored.add(next_key)
+                        frontier.append((next_boxes, next_region))
+
+        self.corral_cache[key] = deadlock
+        if len(self.corral_cache) > self.corral_cache_size:
+            self.corral_cache.popitem(last=False)
+        return deadlock
+
+    def successors(self, state: SokobanState):
+        """
+        Generate the valid pushes of a state together with their resulting
+        states and costs (see search.Problem.successors).
+        Pushes into a freeze deadlock are pruned if freeze_check is set,
+        pushes making a deadlock pattern if pattern_store is set,
+        pushes leaving a box without a target if matching_check is set,
+        states with a corral deadlock if corral_check is set, and the pushes
+        of the boxes outside a PI-corral if pi_corral_check is set.
+        :param state: a given state of the warehouse.
+        :return: a generator of ((box, direction), next_state, step_cost) triples.
+        """
+        distances = self.reachable(state)
+        boxes = state.boxes
+        match = self.box_matching(boxes, boxes) if self.matching_check else None
+        box_set = frozenset(boxes)
+        use_corrals = self.corral_check or self.pi_corral_check
+
+        # Boxes allowed to be pushed when there is a PI-corral
+        pi_corral_boxes = None
+        if use_corrals:
+            for cells, corral_boxes in self.corrals(state):
+                if not self.is_pi_corral(state, distances, cells, corral_boxes):
+                    continue
+                # The worker will have to push into the PI-corral: if its boxes
+                # cannot be solved, neither can the state
+                if self.corral_check and self.corral_deadlock(state, cells, corral_boxes):
+                    self.pruned['corral_deadlock'] += 1
+                    return
+                if self.pi_corral_check and \
+                   (pi_corral_boxes is None or len(corral_boxes) < len(pi_corral_boxes)):
+                    pi_corral_boxes = corral_boxes
+
+        for i, (box_x, box_y) in enumerate(boxes):
+            for action in ['Up', 'Down', 'Left', 'Right']:
+                dx, dy = deltas[action]
+                # The worker has to be able to walk to the cell behind the box
+                push_from = (box_x - dx, box_y - dy)
+                if push_from not in distances:
+                    continue
+                next_box_pos = (box_x + dx, box_y + dy)
+                if next_box_pos in self.walls or \
+                   next_box_pos in boxes or \
+                   next_box_pos in self.tabooCells:
+                    continue
+                if pi_corral_boxes is not None and (box_x, box_y) not in pi_corral_boxes:
+                    self.pruned['pi_corral'] += 1
+                    continue
+                next_boxes = self.move_box(boxes, i, next_box_pos)
+                if self.freeze_check and self.freeze_deadlock(next_boxes, next_box_pos):
+                    self.pruned['freeze'] += 1
+                    continue
+                if self.pattern_store is not None and self.pattern_deadlock(next_boxes, next_box_pos):
+                    self.pruned['pattern'] += 1
+                    continue
+                if match is not None and self.matching_deadlock(match, (box_x, box_y), next_box_pos, next_boxes):
+                    self.pruned['matching'] += 1
+                    continue
+                if use_corrals:
+                    # The components of the child are derived from those of
+                    # the state, which corrals has just cached
+                    self.reachability.components_after_push(box_set, (box_x, box_y), next_box_pos)
+                yield ((box_x, box_y), action), \
+                      SokobanState((box_x, box_y), next_boxes), \
+                      distances[push_from] + 1 + self.weights[i]
+
+    def actions(self, state: SokobanState) -> list:
+        """
+        :param state: a given state of the warehouse.
+        :return: the list of valid pushes (box, direction) in the given state.
+        """
+        return [action for action, _, _ in self.successors(state)]
+
+    def result(self, state: SokobanState, action) -> SokobanState:
+        """
+        Applies the given push to the given state and returns the resulting state.
+        The push is applied directly: the pushed box moves one cell and the
+        worker ends where the box was. The action must be one of
+        actions(state), which checked that the push is valid.
+        :param state: a given state of the warehouse.
+        :param action: a push (box, direction).
+        :return: a new state resulting from applying the push to the given state.
+        """
+        box, direction = action
+        dx, dy = deltas[direction]
+        next_boxes = self.move_box(state.boxes, state.boxes.index(box), (box[0] + dx, box[1] + dy))
+        return SokobanState(box, next_boxes)
+
+    def path_cost(self, c, state1: SokobanState, action, state2: SokobanState):
+        """
+        Calculate the cost of a path from state 1 to state 2 via the given push, assuming cost c.
+        The walking distances of state 1 come from reachable, which remembers
+        those of the last state (see ReachabilityCache): the original
+        search.py calls path_cost for every action of a state right after
+        actions.
+        :param c: cost to move to state 1.
+        :param state1: current state.
+        :param action: a push (box, direction).
+        :param state2: state resulting from applying the push.
+        :return: total cost of path to state 2.
+        """
+        (box_x, box_y), direction = action
+        dx, dy = deltas[direction]
+        walk = self.reachable(state1)[(box_x - dx, box_y - dy)]
+        return c + walk + 1 + self.weights[state1.boxes.index((box_x, box_y))]
+
+    def expand_plan(self, pushes: list) -> list[str]:
+        """
+        Expand a sequence of pushes from the initial state into the worker's
+        elementary actions.
+        :param pushes: a list of pushes (box, direction).
+        :return: the list of actions 'Left', 'Right', 'Up', 'Down'.
+        """
+        worker = self.initial.worker
+        boxes = set(self.initial.boxes)
+        plan = []
+        for box, action in pushes:
+            dx, dy = deltas[action]
+            plan += worker_path(self.walls, boxes, worker, (box[0] - dx, box[1] - dy))
+            plan.append(action)
+            boxes.remove(box)
+            boxes.add((box[0] + dx, box[1] + dy))
+            worker = box
+        return plan
+
+class SokobanPullPuzzle(search.Problem):
+    """
+    The backward ("pull") version of a SokobanPushPuzzle, searched from the
+    solved box configurations towards the initial state by
+    search.bidirectional_astar_search.
+
+    Its states are the states of the push puzzle: the worker stands where
+    the last pushed box was. The successors of a state are its predecessors
+    in the push puzzle: the box in front of the worker is pulled back onto
+    the worker's cell, the worker steps back behind it, and then walks back
+    to any cell where it can have stopped after the previous push (next to
+    a box, or at its initial position). The step costs are those of the
+    push puzzle.
+    The initial states are every solved configuration of the boxes (boxes
+    of equal weight are interchangeable, boxes of different weights are not)
+    with the worker next to a box, i.e. every way the last push can end.
+    Their number grows like the factorial of the number of distinct weights,
+    so a puzzle with more than max_roots of them (see count_roots) is
+    rejected instead of filling the memory before the search starts.
+    """
+    max_roots = 20000
+
+    @staticmethod
+    def count_roots(puzzle: SokobanPushPuzzle) -> int:
+        """
+        Upper bound on the number of initial states of the pull puzzle of a
+        push puzzle, computed without listing them.
+        :param puzzle: the SokobanPushPuzzle searched forward.
+        :return: the number of solved configurations of the boxes times the
+            largest number of cells next to the boxes.
+        """
+        free_targets = len(puzzle.targets)
+        configurations = 1
+        for start, end in sorted(set(puzzle.box_groups)):
+            configurations *= math.comb(free_targets, end - start)
+            free_targets -= end - start
+        return configurations * 4 * len(puzzle.weights)
+
+    def __init__(self, puzzle: SokobanPushPuzzle):
+        """
+        :param puzzle: the SokobanPushPuzzle searched forward.
+        Raises ValueError if the puzzle has more than max_roots solved states.
+        """
+        roots = self.count_roots(puzzle)
+        if roots > self.max_roots:
+            raise ValueError("the puzzle has up to {} solved states, more than max_roots = {}."
+                             .format(roots, self.max_roots))
+        self.puzzle = puzzle
+        self.floor = puzzle.reachability.neighbours
+        self.goal = puzzle.initial
+
+        # Solved configurations: each group of boxes of equal weight is put
+        # on a combination of the targets left by the previous groups
+        groups = sorted(set(puzzle.box_groups))
+
+        def configurations(k, free_targets):
+            if k == len(groups):
+                yield ()
+                return
+            start, end = groups[k]
+            for chosen in itertools.combinations(sorted(free_targets), end - start):
+                for rest in configurations(k + 1, free_targets - set(chosen)):
+                    yield chosen + rest
+
+        self.initial = []
+        for boxes in configurations(0, set(puzzle.targets)):
+            self.initial += [SokobanState(worker, boxes) for worker in self.stop_cells(boxes)]
+
+        # Least number of pushes from the initial positions of the boxes of
+        # each weight to every cell, used by the heuristic
+        self.push_distances = {}
+        for box, weight in zip(puzzle.initial.boxes, puzzle.weights):
+            table = self.push_distances.setdefault(weight, {})
+            for cell, distance in self.box_distances(box).items():
+                if distance < table.get(cell, INFEASIBLE_COST):
+                    table[cell] = distance
+
+    def box_distances(self, start: tuple[int,int]) -> dict:
+        """
+        Breadth first search of the pushes of a single box, taking the walls
+        into account but ignoring the other boxes: a box on cell c can be
+        pushed to c+d if neither c-d nor c+d is a wall.
+        :param start: initial position (x,y) of the box.
+        :return: dictionary mapping each cell the box can be pushed to to the number of pushes.
+        """
+        distances = {start: 0}
+        frontier = collections.deque([start])
+        while frontier:
+            x, y = frontier.popleft()
+            for dx, dy in deltas.values():
+                next_pos = (x + dx, y + dy)
+                if next_pos in self.floor and (x - dx, y - dy) in self.floor and next_pos not in distances:
+                    distances[next_pos] = distances[(x, y)] + 1
+                    frontier.append(next_pos)
+        return distances
+
+    def stop_cells(self, boxes, region=None) -> set:
+        """
+        :param boxes: the box positions of a state.
+        :param region: optional collection of cells the worker is limited to.
+        :return: the set of free cells where the worker can stand right after
+            a push (next to a box), plus the initial position of the worker
+            if boxes is the initial configuration.
+        """
+        occupied = set(boxes)
+        cells = set()
+        for box_x, box_y in boxes:
+            for dx, dy in deltas.values():
+                cell = (box_x - dx, box_y - dy)
+                if cell in self.floor and cell not in occupied and (region is None or cell in region):
+                    cells.add(cell)
+        if boxes == self.goal.boxes and (region is None or self.goal.worker in region):
+            cells.add(self.goal.worker)
+        return cells
+
+    def successors(self, state: SokobanState):
+        """
+        Generate the predecessors of a state in the push puzzle together with
+        the pushes leading from them to the state and their costs
+        (see search.Problem.successors).
+        :param state: a given state of the warehouse.
+        :return: a generator of ((box, direction), previous_state, step_cost)
+            triples, where (box, direction) is the push from previous_state to state.
+        """
+        worker_x, worker_y = state.worker
+        boxes = state.boxes
+        for action in ['Up', 'Down', 'Left', 'Right']:
+            dx, dy = deltas[action]
+            # The last push moved the box in front of the worker from the
+            # worker's cell, and the worker was behind it
+            box = (worker_x + dx, worker_y + dy)
+            push_from = (worker_x - dx, worker_y - dy)
+            if box not in boxes or push_from not in self.floor or push_from in boxes or \
+               state.worker in self.puzzle.tabooCells:
+                continue
+            i = boxes.index(box)
+            # The box must have come from the initial position of a box of its weight
+            if state.worker not in self.push_distances[self.puzzle.weights[i]]:
+                continue
+            previous_boxes = self.puzzle.move_box(boxes, i, state.worker)
+            distances = self.puzzle.reachability.distances(frozenset(previous_boxes), push_from)
+            for worker in self.stop_cells(previous_boxes, distances):
+                yield (state.worker, action), \
+                      SokobanState(worker, previous_boxes), \
+                      distances[worker] + 1 + self.puzzle.weights[i]
+
+    def actions(self, state: SokobanState) -> list:
+        """
+        :param state: a given state of the warehouse.
+        :return: the list of pushes (box, direction) that can lead to the given state.
+        """
+        return [action for action, _, _ in self.successors(state)]
+
+    def goal_test(self, state: SokobanState):
+        """
+        :param state: current state of the warehouse.
+        :return: True if the state is the initial state of the push puzzle.
+        """
+        return state == self.goal
+
+    def heuristic(self, node: search.Node):
+        """
+        Admissible estimate of the cost from the initial state of the push
+        puzzle to the state of a node: every box has to be pushed to its cell
+        from the initial position of a box of the same weight, each push of a
+        box of weight w costing at least 1 + w.
+        :param node: a node of the backward search.
+        :return: the estimated cost, INFEASIBLE_COST if a box cannot have been pushed to its cell.
+        """
+        total = 0
+        for box, weight in zip(node.state.boxes, self.puzzle.weights):
+            distance = self.push_distances[weight].get(box)
+            if distance is None:
+                return INFEASIBLE_COST
+            total += distance * (1 + weight)
+        return total
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 # Problem domains addressed by AI have *hard* and *soft* constraints
@@ -637,13 +2264,183 @@ def run_tests(path):
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def solve_weighted_sokoban(warehouse):
+def make_sokoban_problem(warehouse, backend='tuple', mode='push', heuristic='push',
+                         freeze=True, matching=False, corral=False, pi_corral=False, patterns=None):
+    """
+    Build the search problem and the heuristic of solve_weighted_sokoban
+    (see solve_weighted_sokoban for the options).
+    :param warehouse: a valid Warehouse object
+    :return: (problem, h) where problem is a SokobanPuzzle and h an admissible heuristic of its nodes.
+    """
+    # Create a SokobanPuzzle instance
+    if mode not in ('push', 'step'):
+        raise ValueError("mode must be either 'push' or 'step'.")
+    if backend == 'tuple':
+        problem = SokobanPushPuzzle(warehouse) if mode == 'push' else SokobanPuzzle(warehouse)
+    elif backend == 'bitboard' and mode == 'step':
+        problem = BitboardSokobanPuzzle(warehouse)
+    elif backend == 'bitboard':
+        raise ValueError("The bitboard backend only supports mode='step'.")
+    else:
+        raise ValueError("backend must be either 'tuple' or 'bitboard'.")
+    problem.freeze_check = freeze
+    problem.matching_check = matching
+    if patterns is not None:
+        problem.pattern_store = DeadlockPatternStore(patterns)
+    if mode == 'push':
+        problem.corral_check = corral
+        problem.pi_corral_check = pi_corral
+    elif corral or pi_corral:
+        raise ValueError("Corral pruning is only supported by mode='push'.")
+
+    # Admissible heuristic function for A* search
+    if heuristic == 'push':
+        h = problem.push_distance_heuristic
+    elif heuristic == 'matching':
+        h = problem.matching_heuristic
+    elif heuristic == 'manhattan':
+        h = problem.manhattan_heuristic
+    else:
+        raise ValueError("heuristic must be 'matching', 'push' or 'manhattan'.")
+    # The heuristics only depend on the boxes: share their values between
+    # the states that differ by the position of the worker (when search.py
+    # provides HeuristicCache; the original search.py does not)
+    if hasattr(search, 'HeuristicCache'):
+        h = search.HeuristicCache(h, key=lambda node: node.state.boxes)
+
+    return problem, h
+
+def finish_search(problem, report=None, stats=None):
+    """
+    Save what a search learned and report its counters.
+    :param problem: the problem built by make_sokoban_problem.
+    :param report: optional dictionary, updated with the number of states pruned by each rule
+        (and the reachability cache counters of a push search).
+    :param stats: optional search.SearchStats, whose counters are updated in the same way.
+    """
+    if problem.pattern_store is not None and problem.pattern_store.learned:
+        problem.pattern_store.save()
+    if report is not None:
+        report.update(problem.pruned)
+    if stats is not None:
+        stats.counters.update(problem.pruned)
+    reachability = getattr(getattr(problem, 'puzzle', problem), 'reachability', None)
+    if reachability is not None:
+        counters = {'reachability_' + name: value for name, value in reachability.stats().items()}
+        if report is not None:
+            report.update(counters)
+        if stats is not None:
+            stats.counters.update(counters)
+
+def solution_plan(problem, node) -> tuple[list[str],int]:
+    """
+    :param problem: the problem built by make_sokoban_problem.
+    :param node: a goal node of the problem.
+    :return: (S, C) where S is the list of the worker's actions
+        ('Left', 'Right', 'Up', 'Down') leading to the node and C their total cost.
+    """
+    # Extract the action sequence from the solution node
+    action_sequence = node.solution()
+    if isinstance(problem, SokobanPushPuzzle):
+        action_sequence = problem.expand_plan(action_sequence)
+
+    # The total cost of the action sequence is the path cost of the node
+    return action_sequence, node.path_cost
+
+def pushed_box(node) -> dict:
+    """
+    Extra trace fields of a node of a SokobanPuzzle (see search.ExpansionTracer).
+    :param node: a search node of a SokobanPuzzle or SokobanPushPuzzle.
+    :return: {'box': [x, y]} where (x,y) is the cell the last action pushed
+        a box onto, or {} if it pushed no box (or the states are bitboards).
+    """
+    if node.parent is None or not isinstance(node.state, SokobanState):
+        return {}
+    moved = set(node.state.boxes) - set(node.parent.state.boxes)
+    return {'box': list(moved.pop())} if moved else {}
+
+def solve_weighted_sokoban(warehouse, frontier='heap', backend='tuple', mode='push', heuristic='push',
+                           freeze=True, matching=False, corral=False, pi_corral=False, patterns=None,
+                           engine='astar', workers=None, report=None, return_stats=False, budget=None,
+                           checkpoint=None):
     """
     This function analyses the given warehouse.
     It returns the two items. The first item is an action sequence solution.
     The second item is the total cost of this action sequence.
 
     :param warehouse: a valid Warehouse object
+    :param frontier: open list used by A*.
+        'heap': binary heap ordered by (f, node) (search.IndexedPriorityQueue).
+        'bucket': one bucket per integer f value, preferring the deepest node
+            within a bucket (search.BucketPriorityQueue). Path costs and the
+            heuristic are integers, so no string comparisons are needed.
+        'priority_queue': the original search.PriorityQueue, whose membership
+            tests and deletions scan the whole heap. Only kept as the baseline
+            of the benchmarks. Raises ValueError with a checkpoint.
+    :param backend: state representation of the puzzle.
+        'tuple': SokobanState with (x,y) tuples (SokobanPuzzle).
+        'bitboard': integer masks (BitboardSokobanPuzzle).
+    :param mode: what a search step is.
+        'push': a walk of the worker followed by a push (SokobanPushPuzzle).
+            Only the tuple backend is supported.
+        'step': a single move of the worker.
+    :param heuristic: admissible heuristic used by A*.
+        'matching': minimum-cost assignment of the boxes to distinct targets
+            using the weighted wall-aware push distances.
+        'push': weighted wall-aware push distances to the nearest targets.
+        'manhattan': Manhattan distances to the nearest targets.
+    :param freeze: prune the pushes that freeze boxes off target.
+    :param matching: prune the pushes after which the boxes cannot be
+        assigned to distinct targets they can be pushed to.
+    :param corral: prune the states with a corral deadlock (see
+        SokobanPushPuzzle). Only supported by mode='push'. The plan is still
+        least-cost.
+    :param pi_corral: only push the boxes around a PI-corral when there is
+        one (see SokobanPushPuzzle). Only supported by mode='push'.
+        May return a plan that is not least-cost.
+    :param patterns: path of a JSON file of deadlock patterns
+        (see DeadlockPatternStore). The patterns are loaded from the file
+        if it exists, used to prune the pushes, and the file is updated
+        with the patterns learned during the search. None to disable.
+    :param engine: search algorithm.
+        'astar': A* graph search (search.astar_graph_search).
+        'idastar': iterative deepening A* with a bounded transposition table
+            (search.idastar_search). Much less memory than A*, but states
+            are expanded again at every iteration. Ignores frontier.
+        'bidirectional': a forward search of pushes from the initial state
+            and a backward search of pulls from the solved configurations
+            (SokobanPullPuzzle) meeting in the middle
+            (search.bidirectional_astar_search). Only supported by
+            mode='push'. Ignores frontier. If the puzzle has too many
+            solved configurations (see SokobanPullPuzzle.max_roots), the
+            'astar' engine is used instead and report['engine'] is set
+            to 'astar'.
+        'hdastar': hash-distributed A* over a pool of worker processes
+            (search.hdastar_search). Ignores frontier, and the states
+            pruned by the workers are not reported. The processes are
+            forked, so on Windows and macOS this runs A* in this process.
+        'greedy': greedy best-first search ordered by the heuristic alone
+            (search.greedy_best_first_graph_search). Usually much faster,
+            but the plan is not least-cost in general.
+    :param workers: number of worker processes of the 'hdastar' engine
+        (default: the number of CPUs).
+    :param report: optional dictionary, updated with the number of states
+        pruned by each deadlock rule (e.g. report['freeze']), and with the
+        rule of SokobanPuzzle.analyse that proved the puzzle unsolvable
+        before the search (report['impossible']) if any, and with the
+        engine used instead of 'bidirectional' (report['engine']) if any.
+    :param return_stats: if True, or a search.SearchStats to fill in (e.g.
+        with hooks or timing), also return the statistics of the search.
+        The node counters are filled in by the 'astar' and 'greedy' engines,
+        and the nodes expanded and generated by the 'hdastar' engine;
+        stats.counters holds the states pruned by each deadlock rule, as in
+        report, for every engine.
+    :param budget: optional search.SearchBudget (node limit, deadline and
+        cancellation token) checked by the search. The 'hdastar' engine
+        only checks the deadline and the token.
+    :param checkpoint: optional search.SearchCheckpoint of the 'astar' and
+        'greedy' engines: the search resumes from its snapshot if there is
+        one, and saves snapshots while it runs and when it runs out of budget.
     :return:
         If puzzle cannot be solved
             return 'Impossible', None
@@ -654,61 +2451,307 @@ def solve_weighted_sokoban(warehouse):
             For example, ['Left', 'Down', Down','Right', 'Up', 'Down']
             If the puzzle is already in a goal state, simply return []
             C is the total cost of the action sequence C
+        If the search ran out of budget
+            return E, None where E is a search.BudgetExhausted
+        With return_stats, return S, C, stats where stats is a search.SearchStats.
     """
-    # Create a SokobanPuzzle instance
-    problem = SokobanPuzzle(warehouse)
+    # search attributes that the original search.py lacks are only looked
+    # up when the options that need them are used
+    stats = None
+    if return_stats is True:
+        stats = search.SearchStats()
+    elif return_stats:
+        stats = return_stats
+    S, C = search_weighted_sokoban(warehouse, frontier, backend, mode, heuristic, freeze, matching,
+                                   corral, pi_corral, patterns, engine, workers, report, stats, budget,
+                                   checkpoint)
+    if stats is None:
+        return S, C
+    return S, C, stats
+
+def search_weighted_sokoban(warehouse, frontier, backend, mode, heuristic, freeze, matching,
+                            corral, pi_corral, patterns, engine, workers, report, stats, budget,
+                            checkpoint):
+    """
+    Body of solve_weighted_sokoban (see solve_weighted_sokoban for the parameters).
+    :param stats: a search.SearchStats to fill in, or None.
+    :param budget: a search.SearchBudget, or None.
+    :param checkpoint: a search.SearchCheckpoint, or None.
+    :return: S, C as in solve_weighted_sokoban.
+    """
+    if frontier == 'priority_queue' and checkpoint is not None:
+        # The snapshots need the items of the frontier, which PriorityQueue
+        # cannot list: fail now rather than at the first snapshot
+        raise ValueError("checkpoint is not supported by frontier='priority_queue'.")
+    problem, h = make_sokoban_problem(warehouse, backend, mode, heuristic,
+                                      freeze, matching, corral, pi_corral, patterns)
 
     # Check if the puzzle is already in a goal state
     if problem.goal_test(problem.initial):
+        # The search is not run, so remove a stale snapshot here
+        if checkpoint is not None:
+            checkpoint.remove()
         return [], 0
 
-    # Define an adaptive heuristic function for A* search
-    def h(node):
- 
-        # Simple admissible heuristic: Sum of Manhattan distances from each box to its nearest target.
-        # This ignores weights, ensuring admissibility as weights >= 0.
-        total_distance = 0
- 
-        # Unpack the state
-        current_warehouse = sokoban.Warehouse()
-        current_warehouse.from_lines(node.state.splitlines()) 
-        box_positions = current_warehouse.boxes
-        targets = problem.warehouse_obj.targets # Use targets from the problem instance
- 
-        if not targets: # Handle case with no targets
-            return 0
-        
-        # Calculate the sum of minimum Manhattan distances for each box to any target
- 
-        for box in box_positions:
-            min_distance_for_box = float('inf')
-            for target in targets: 
-                distance = abs(box[0] - target[0]) + abs(box[1] - target[1])
-                min_distance_for_box = min(min_distance_for_box, distance)
-
-            # If a box cannot reach any target (e.g., targets list is empty, though checked above), 
-            # handle appropriately. Here we add 0 if min_distance remains inf.
- 
-            if min_distance_for_box != float('inf'):
-                total_distance += min_distance_for_box
-
-        return total_distance
+    # Answer the puzzles that obviously cannot be solved without searching
+    rule = problem.analyse()
+    if rule is not None:
+        if checkpoint is not None:
+            checkpoint.remove()
+        if report is not None:
+            report['impossible'] = rule
+        return 'Impossible', None
 
-    # Use A* search to find a solution
-    solution_node = search.astar_graph_search(problem, h)
+    if frontier == 'heap':
+        # Default open list of best_first_graph_search (IndexedPriorityQueue,
+        # or PriorityQueue with the original search.py)
+        frontier_factory = None
+    elif frontier == 'bucket':
+        frontier_factory = functools.partial(search.BucketPriorityQueue, tie_break='high_g')
+    elif frontier == 'priority_queue':
+        # PriorityQueue has no key: its items are compared with ==, which
+        # compares the states of nodes
+        frontier_factory = lambda f, key: search.PriorityQueue('min', f)
+    else:
+        raise ValueError("frontier must be 'heap', 'bucket' or 'priority_queue'.")
+
+    if engine == 'bidirectional' and mode == 'push' and \
+       SokobanPullPuzzle.count_roots(problem) > SokobanPullPuzzle.max_roots:
+        # Too many solved configurations to start a backward search from:
+        # search forward only
+        engine = 'astar'
+        if report is not None:
+            report['engine'] = engine
+
+    # Use A* search (or IDA*) to find a solution
+    # Only pass the options that are set, so that the default search also
+    # runs with the original search.py
+    options = {name: value for name, value in [('frontier_factory', frontier_factory), ('stats', stats),
+                                               ('budget', budget), ('checkpoint', checkpoint)]
+               if value is not None}
+    if engine == 'astar':
+        solution_node = search.astar_graph_search(problem, h, **options)
+    elif engine == 'idastar':
+        solution_node = search.idastar_search(problem, h, budget=budget)
+    elif engine == 'hdastar':
+        solution_node = search.hdastar_search(problem, h, workers, budget=budget, stats=stats)
+    elif engine == 'greedy':
+        solution_node = search.greedy_best_first_graph_search(problem, h, **options)
+    elif engine == 'bidirectional' and mode == 'push':
+        backward = SokobanPullPuzzle(problem)
+        h_backward = search.HeuristicCache(backward.heuristic, key=lambda node: node.state.boxes)
+        meeting = search.bidirectional_astar_search(problem, backward, h, h_backward, budget)
+        finish_search(problem, report, stats)
+        if meeting is None:
+            return 'Impossible', None
+        if budget is not None and isinstance(meeting, search.BudgetExhausted):
+            return meeting, None
+        node, backward_node = meeting
+        # The backward nodes hold the pushes from their state towards the goal
+        pushes = node.solution()
+        cost = node.path_cost
+        while backward_node is not None and backward_node.parent is not None:
+            pushes.append(backward_node.action)
+            cost += backward_node.path_cost - backward_node.parent.path_cost
+            backward_node = backward_node.parent
+        return problem.expand_plan(pushes), cost
+    elif engine == 'bidirectional':
+        raise ValueError("The bidirectional engine is only supported by mode='push'.")
+    else:
+        raise ValueError("engine must be 'astar', 'idastar', 'hdastar', 'greedy' or 'bidirectional'.")
+    finish_search(problem, report, stats)
 
     # If no solution was found, return 'Impossible'
     if solution_node is None:
         return 'Impossible', None
+    if budget is not None and isinstance(solution_node, search.BudgetExhausted):
+        return solution_node, None
 
-    # Extract the action sequence from the solution node
-    action_sequence = solution_node.solution()
+    return solution_plan(problem, solution_node)
+
+def solve_weighted_sokoban_anytime(warehouse, time_budget: float, epsilon: float = 3.0, step: float = 0.5,
+                                   report=None, **options):
+    """
+    Anytime version of solve_weighted_sokoban: a first plan is found quickly
+    by weighted A* and improved until the time budget runs out or the plan
+    is proven least-cost (search.arastar_search).
+
+    :param warehouse: a valid Warehouse object
+    :param time_budget: time limit of the search in seconds.
+    :param epsilon: initial weight of the heuristic (the first plan costs
+        at most epsilon times the least cost).
+    :param step: decrease of the weight after each plan.
+    :param report: optional dictionary, see solve_weighted_sokoban.
+    :param options: backend, mode, heuristic, freeze, matching, corral,
+        pi_corral and patterns, see solve_weighted_sokoban.
+    :return:
+        If puzzle cannot be solved
+            return 'Impossible', None, None
+        If no plan was found within the time budget
+            return None, None, None
+        Otherwise return S, C, B
+            where S and C are the best plan found and its cost as in
+            solve_weighted_sokoban, and B is a bound on its suboptimality:
+            C is at most B times the least cost (B = 1.0 if C is the least cost).
+    """
+    deadline = time.perf_counter() + time_budget
+    problem, h = make_sokoban_problem(warehouse, **options)
 
-    # Calculate the total cost of the action sequence
-    total_cost = solution_node.path_cost
+    # Check if the puzzle is already in a goal state
+    if problem.goal_test(problem.initial):
+        return [], 0, 1.0
+
+    rule = problem.analyse()
+    if rule is not None:
+        if report is not None:
+            report['impossible'] = rule
+        return 'Impossible', None, None
+
+    solution_node, bound, timed_out = None, None, False
+    for node, node_bound in search.arastar_search(problem, h, epsilon, step, deadline):
+        if node is None:
+            # The deadline passed before the first plan was found
+            timed_out = True
+            continue
+        solution_node, bound = node, node_bound
+        # Record the cost and bound of every improved plan
+        if report is not None:
+            report.setdefault('plans', []).append((solution_node.path_cost, bound))
+    finish_search(problem, report)
 
-    return action_sequence, total_cost
+    if solution_node is None:
+        # Without a plan, the search either ran out of time or proved that there is none
+        return (None if timed_out else 'Impossible'), None, None
+    return solution_plan(problem, solution_node) + (bound,)
+
+# Strategies raced by solve_weighted_sokoban_portfolio: name -> options of solve_weighted_sokoban
+PORTFOLIO_STRATEGIES = {
+    'push': {'heuristic': 'push'},
+    'matching': {'heuristic': 'matching', 'matching': True},
+    'manhattan': {'heuristic': 'manhattan'},
+    'bidirectional': {'engine': 'bidirectional'},
+    'greedy': {'engine': 'greedy'},
+}
 
-warehouse = intialise_warehouse("./Assigment1/warehouses/warehouse_003.txt")
-print(solve_weighted_sokoban(warehouse))
-# print(taboo_cells(warehouse))
\ No newline at end of file
+def is_least_cost(options: dict) -> bool:
+    """
+    :param options: options of solve_weighted_sokoban.
+    :return: True if the plans found with these options are least-cost.
+    """
+    return options.get('engine', 'astar') != 'greedy' and not options.get('pi_corral', False)
+
+def _portfolio_worker(name, warehouse, options, results):
+    """ Run one strategy of solve_weighted_sokoban_portfolio and send (name, S, C) to results. """
+    try:
+        S, C = solve_weighted_sokoban(warehouse, **options)
+        if isinstance(S, getattr(search, 'BudgetExhausted', ())):
+            # The stats may hold hooks that cannot be pickled
+            S.stats = None
+        results.put((name, S, C))
+    except Exception as e:
+        results.put((name, e, None))
+
+def _portfolio_in_turn(warehouse, strategies, deadline):
+    """
+    Run the strategies of solve_weighted_sokoban_portfolio one after the
+    other in this process, each stopped at the deadline if search.py has
+    budgets and the strategy has no budget of its own.
+    :return: a generator of the (name, S, C) answers of the strategies.
+    """
+    for name, options in strategies.items():
+        if deadline is not None:
+            if time.perf_counter() >= deadline:
+                return
+            if 'budget' not in options and hasattr(search, 'SearchBudget'):
+                options = dict(options, budget=search.SearchBudget(deadline=deadline))
+        results = queue.Queue()
+        _portfolio_worker(name, warehouse, options, results)
+        yield results.get()
+
+def solve_weighted_sokoban_portfolio(warehouse, strategies=None, timeout=None, report=None):
+    """
+    Race several configurations of solve_weighted_sokoban, each in its own
+    process, and return the first answer that is known to be right: a plan
+    of a least-cost strategy (see is_least_cost), or 'Impossible' from any
+    strategy (all the searches are complete). The other processes are then
+    stopped. The plan of a strategy that is not least-cost (e.g. 'greedy')
+    is only returned if no other strategy answers in time. A strategy that
+    runs out of its own budget (a 'budget' option) gives no answer, and the
+    portfolio keeps waiting for the others.
+    The processes are forked. Where forking is not available (Windows) or
+    not safe (macOS), the strategies are run one after the other in this
+    process instead, in the order of strategies, until one of them gives
+    an answer that is known to be right.
+
+    :param warehouse: a valid Warehouse object
+    :param strategies: dictionary of strategy name -> options of
+        solve_weighted_sokoban (default: PORTFOLIO_STRATEGIES).
+    :param timeout: time limit in seconds, None for no limit.
+    :param report: optional dictionary, updated with the name of the
+        strategy whose answer is returned (report['strategy']), whether it
+        is proven least-cost or impossible (report['proven']), the errors
+        raised by the strategies (report['errors']), and the reasons the
+        strategies ran out of budget (report['exhausted']).
+    :return:
+        'Impossible', None or S, C as in solve_weighted_sokoban,
+        or None, None if no strategy answered within the time limit or
+        all of them ran out of budget.
+    """
+    if strategies is None:
+        strategies = PORTFOLIO_STRATEGIES
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    processes = []
+    if sys.platform == 'darwin' or 'fork' not in multiprocessing.get_all_start_methods():
+        answers = _portfolio_in_turn(warehouse, strategies, deadline)
+    else:
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=_portfolio_worker, args=(name, warehouse, options, results),
+                                     daemon=True)
+                     for name, options in strategies.items()]
+        for process in processes:
+            process.start()
+
+        def answers_in_parallel():
+            for _ in processes:
+                remaining = None if deadline is None else max(0, deadline - time.perf_counter())
+                try:
+                    yield results.get(timeout=remaining)
+                except queue.Empty:
+                    return
+        answers = answers_in_parallel()
+
+    answer, fallback = None, None
+    try:
+        for name, S, C in answers:
+            if isinstance(S, Exception):
+                if report is not None:
+                    report.setdefault('errors', {})[name] = repr(S)
+                continue
+            if isinstance(S, getattr(search, 'BudgetExhausted', ())):
+                if report is not None:
+                    report.setdefault('exhausted', {})[name] = S.reason
+                continue
+            if S == 'Impossible' or is_least_cost(strategies[name]):
+                answer = (name, S, C)
+                break
+            if fallback is None or C < fallback[2]:
+                fallback = (name, S, C)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    if answer is None and fallback is None:
+        return None, None
+    name, S, C = answer or fallback
+    if report is not None:
+        report['strategy'] = name
+        report['proven'] = answer is not None
+    return S, C
+
+if __name__ == "__main__":
+    warehouse = intialise_warehouse("./Assigment1/warehouses/warehouse_003.txt")
+    print(solve_weighted_sokoban(warehouse))
+    # print(taboo_cells(warehouse))
\ No newline at end of file
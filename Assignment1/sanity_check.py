@@ -14,6 +14,7 @@ marking your code, make sure that your code runs without errors with this script
 
 '''
 
+import os
 
 from sokoban import Warehouse
 
@@ -25,10 +26,12 @@ except ModuleNotFoundError:
     from mySokobanSolver import taboo_cells, solve_weighted_sokoban, check_elem_action_seq
     print("Using submitted solver")
 
+# The warehouses are found relative to this script, wherever it is run from
+WAREHOUSE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouses')
     
 def test_taboo_cells():
     wh = Warehouse()
-    wh.load_warehouse("./Assigment1/warehouses/warehouse_001.txt")
+    wh.load_warehouse(os.path.join(WAREHOUSE_DIR, 'warehouse_001.txt'))
     expected_answer = '####  \n#X #  \n#  ###\n#   X#\n#   X#\n#XX###\n####  '
     answer = taboo_cells(wh)
     fcn = test_taboo_cells    
@@ -42,7 +45,7 @@ def test_taboo_cells():
         
 def test_check_elem_action_seq():
     wh = Warehouse()
-    wh.load_warehouse("./Assigment1/warehouses/warehouse_001.txt")
+    wh.load_warehouse(os.path.join(WAREHOUSE_DIR, 'warehouse_001.txt'))
     # first test
     answer = check_elem_action_seq(wh, ['Right', 'Right','Down'])
     expected_answer = '####  \n# .#  \n#  ###\n#*   #\n#  $@#\n#  ###\n####  '
@@ -68,7 +71,7 @@ def test_check_elem_action_seq():
 
 def test_solve_weighted_sokoban():
     wh = Warehouse()    
-    wh.load_warehouse( "./Assigment1/warehouses/warehouse_008a.txt")
+    wh.load_warehouse(os.path.join(WAREHOUSE_DIR, 'warehouse_008a.txt'))
     # first test
     answer, cost = solve_weighted_sokoban(wh)
 
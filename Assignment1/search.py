@@ -32,6 +32,12 @@ assert sys.version_info >= (3, 5)
 import itertools
 import functools
 import heapq
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import time
 
 import collections # for dequeue
 
@@ -56,6 +62,50 @@ def memoize(fn, slot=None, maxsize=128):
     return memoized_fn
 
 
+class HeuristicCache:
+    """Cache the values of a heuristic function h(node) under key(node).
+    The key lets nodes share a cached value, e.g. all the nodes whose states
+    have the same box positions in Sokoban, as long as h(node) only depends
+    on key(node).
+    At most maxsize values are kept. When the cache is full, policy decides
+    which value is evicted:
+        'lru'  -- the least recently used value
+        'fifo' -- the oldest value
+    The hits and misses counters measure the usefulness of the cache.
+    An instance is called like the heuristic it wraps."""
+
+    def __init__(self, h, key=lambda node: node.state, maxsize=100000, policy='lru'):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError("policy must be either 'lru' or 'fifo'.")
+        self.h = h
+        self.key = key
+        self.maxsize = maxsize
+        self.policy = policy
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, node):
+        key = self.key(node)
+        try:
+            value = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            value = self.cache[key] = self.h(node)
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        else:
+            self.hits += 1
+            if self.policy == 'lru':
+                self.cache.move_to_end(key)
+        return value
+
+    def hit_rate(self):
+        """Return the fraction of the calls answered from the cache."""
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
 #______________________________________________________________________________
 # Queues: Stack, FIFOQueue, PriorityQueue
 # Stack and FIFOQueue are implemented as list and collection.deque
@@ -164,6 +214,205 @@ class PriorityQueue:
         heapq.heapify(self.heap)
 
 
+class IndexedPriorityQueue:
+    """A PriorityQueue with a hash index from key(item) to its heap entry.
+    Membership tests and f-value lookups are O(1), and replacing an item
+    (delete then append) is O(log n) instead of the linear scan plus
+    heapify done by PriorityQueue.
+    Deleted entries are invalidated lazily: they stay in the heap and are
+    skipped when they reach the top.
+    Items are popped in the same (f(item), item) order as PriorityQueue,
+    so it can be used as a drop-in replacement.
+    The default key is the item itself. For a frontier of nodes use
+    key=lambda node: node.state."""
+
+    def __init__(self, order='min', f=lambda x: x, key=lambda x: x):
+        self.heap = []
+        self.index = {}  # key(item) -> (f(item), item) entry of the live item
+        self.key = key
+        if order == 'min':
+            self.f = f
+        elif order == 'max':  # now item with max f(x)
+            self.f = lambda x: -f(x)  # will be popped first
+        else:
+            raise ValueError("Order must be either 'min' or 'max'.")
+
+    def append(self, item):
+        """Insert item at its correct position.
+        An item already in the queue under the same key is replaced."""
+        entry = (self.f(item), item)
+        self.index[self.key(item)] = entry
+        heapq.heappush(self.heap, entry)
+
+    def extend(self, items):
+        """Insert each item in items at its correct position."""
+        for item in items:
+            self.append(item)
+
+    def pop(self):
+        """Pop and return the item (with min or max f(x) value)
+        depending on the order."""
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            key = self.key(entry[1])
+            # Skip the entries that were deleted or replaced
+            if self.index.get(key) is entry:
+                del self.index[key]
+                return entry[1]
+        raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def __len__(self):
+        """Return the number of live items in the queue."""
+        return len(self.index)
+
+    def items(self):
+        """Return the list of the live items, in no particular order."""
+        return [item for _, item in self.index.values()]
+
+    def __contains__(self, item):
+        """Return True if an item with the same key is in the queue."""
+        return self.key(item) in self.index
+
+    def __getitem__(self, item):
+        """Returns the f value of the item with the same key as item.
+        Raises KeyError if no such item is present."""
+        try:
+            return self.index[self.key(item)][0]
+        except KeyError:
+            raise KeyError(str(item) + " is not in the priority queue")
+
+    def __delitem__(self, item):
+        """Delete the item with the same key as item.
+        Its heap entry is discarded the next time it reaches the top."""
+        try:
+            del self.index[self.key(item)]
+        except KeyError:
+            raise KeyError(str(item) + " is not in the priority queue")
+
+
+class BucketPriorityQueue:
+    """A min-first queue for small integer f values (e.g. A* on problems
+    with integer step costs and an integer heuristic).
+    Items with the same f value share a bucket, so push and pop are O(1)
+    and items are never compared with each other.
+    tie_break selects which item of the lowest bucket is popped first:
+        'lifo'   -- the most recently inserted item
+        'fifo'   -- the least recently inserted item
+        'high_g' -- the item with the highest g(item), LIFO among equal g
+    Supports the same dict-like lookup as IndexedPriorityQueue, and
+    deleted entries are invalidated lazily in the same way."""
+
+    def __init__(self, f=lambda x: x, key=lambda x: x, tie_break='lifo',
+                 g=lambda node: node.path_cost):
+        if tie_break not in ('lifo', 'fifo', 'high_g'):
+            raise ValueError("tie_break must be 'lifo', 'fifo' or 'high_g'.")
+        self.f = f
+        self.g = g
+        self.key = key
+        self.tie_break = tie_break
+        self.buckets = {}  # f value -> bucket of (f(item), item) entries
+        self.fvalues = []  # heap of the f values that have a bucket
+        self.gvalues = {}  # f value -> heap of the negated g values of its 'high_g' bucket
+        self.index = {}  # key(item) -> entry of the live item
+
+    def append(self, item):
+        """Insert item in the bucket of its f value.
+        An item already in the queue under the same key is replaced."""
+        f = self.f(item)
+        entry = (f, item)
+        self.index[self.key(item)] = entry
+        bucket = self.buckets.get(f)
+        if bucket is None:
+            # 'high_g' buckets are split again by g value
+            bucket = {} if self.tie_break == 'high_g' else collections.deque()
+            self.buckets[f] = bucket
+            heapq.heappush(self.fvalues, f)
+            if self.tie_break == 'high_g':
+                self.gvalues[f] = []
+        if self.tie_break == 'high_g':
+            g = self.g(item)
+            entries = bucket.get(g)
+            if entries is None:
+                entries = bucket[g] = []
+                heapq.heappush(self.gvalues[f], -g)
+            entries.append(entry)
+        else:
+            bucket.append(entry)
+
+    def extend(self, items):
+        """Insert each item in items in its bucket."""
+        for item in items:
+            self.append(item)
+
+    def _take(self, f, bucket):
+        """Remove and return the next entry of the non-empty bucket of f."""
+        if self.tie_break == 'lifo':
+            return bucket.pop()
+        if self.tie_break == 'fifo':
+            return bucket.popleft()
+        gvalues = self.gvalues[f]
+        g = -gvalues[0]
+        entries = bucket[g]
+        entry = entries.pop()
+        if not entries:
+            del bucket[g]
+            heapq.heappop(gvalues)
+        return entry
+
+    def pop(self):
+        """Pop and return an item with the minimum f value."""
+        while self.fvalues:
+            f = self.fvalues[0]
+            bucket = self.buckets[f]
+            while bucket:
+                entry = self._take(f, bucket)
+                key = self.key(entry[1])
+                # Skip the entries that were deleted or replaced
+                if self.index.get(key) is entry:
+                    del self.index[key]
+                    return entry[1]
+            # The lowest bucket is exhausted, move on to the next f value
+            del self.buckets[f]
+            self.gvalues.pop(f, None)
+            heapq.heappop(self.fvalues)
+        raise Exception('Trying to pop from empty BucketPriorityQueue.')
+
+    def __len__(self):
+        """Return the number of live items in the queue."""
+        return len(self.index)
+
+    def items(self):
+        """Return the list of the live items, in insertion order within
+        each bucket: appending them to an empty queue with the same
+        tie_break rebuilds a queue that pops them in the same order."""
+        live = []
+        for bucket in self.buckets.values():
+            entries = bucket if self.tie_break != 'high_g' else \
+                itertools.chain.from_iterable(bucket.values())
+            live.extend(entry[1] for entry in entries
+                        if self.index.get(self.key(entry[1])) is entry)
+        return live
+
+    def __contains__(self, item):
+        """Return True if an item with the same key is in the queue."""
+        return self.key(item) in self.index
+
+    def __getitem__(self, item):
+        """Returns the f value of the item with the same key as item.
+        Raises KeyError if no such item is present."""
+        try:
+            return self.index[self.key(item)][0]
+        except KeyError:
+            raise KeyError(str(item) + " is not in the priority queue")
+
+    def __delitem__(self, item):
+        """Delete the item with the same key as item."""
+        try:
+            del self.index[self.key(item)]
+        except KeyError:
+            raise KeyError(str(item) + " is not in the priority queue")
+
+
 #______________________________________________________________________________
 
 class Problem(object):
@@ -206,6 +455,18 @@ class Problem(object):
         and action. The default method costs 1 for every step in the path."""
         return c + 1
 
+    def successors(self, state):
+        """Yield an (action, next_state, step_cost) triple for every action
+        executable in state; Node.expand builds the children from them.
+        The default method calls actions, result and path_cost, so the
+        step cost is path_cost(0, state, action, next_state). A subclass
+        can override it to generate the triples in one pass, as long as
+        it agrees with them:
+            path_cost(c, state, action, next_state) == c + step_cost"""
+        for action in self.actions(state):
+            next_state = self.result(state, action)
+            yield action, next_state, self.path_cost(0, state, action, next_state)
+
     def value(self, state):
         """For optimization problems, each state has a value.  Hill-climbing
         and related algorithms try to maximize this value."""
@@ -242,9 +503,10 @@ class Node:
         return self.state < node.state
 
     def expand(self, problem):
-        """List the nodes reachable in one step from this node."""
-        return [self.child_node(problem, action)
-                for action in problem.actions(self.state)]
+        """List the nodes reachable in one step from this node
+        (see Problem.successors)."""
+        return [Node(next_state, self, action, self.path_cost + step_cost)
+                for action, next_state, step_cost in problem.successors(self.state)]
 
     def child_node(self, problem, action):
         """
@@ -289,49 +551,429 @@ class Node:
 
 #______________________________________________________________________________
 
+class SearchStats:
+    """Statistics of a search, filled in by the search functions that take a
+    stats argument (tree_search, graph_search, best_first_tree_search,
+    best_first_graph_search and the searches built on them):
+        expanded: number of nodes expanded
+        generated: number of child nodes generated
+        duplicates: children dropped because their state was already
+            explored, or is in the frontier with a lower or equal f
+        reopened: frontier nodes replaced by a child with the same state
+            and a lower f (a cheaper path was found)
+        frontier_max: largest size of the frontier
+        elapsed: time taken by the searches in seconds
+        timings: if timed, time spent in each method of the problem
+            ('actions', 'result', 'path_cost', 'goal_test', 'successors')
+            and in the heuristic ('h', A* searches only)
+        counters: extra counters of the caller (e.g. pruned states)
+    Callbacks can be registered with add_hook for the events 'expand',
+    'generate', 'duplicate', 'reopen' and 'goal'; they are called with the
+    node concerned.
+    The search functions only do this work when they are given a
+    SearchStats, so searches without one run at full speed."""
+
+    EVENTS = ('expand', 'generate', 'duplicate', 'reopen', 'goal')
+
+    def __init__(self, timed=False):
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.reopened = 0
+        self.frontier_max = 0
+        self.elapsed = 0.0
+        self.timed = timed
+        self.timings = collections.Counter()
+        self.counters = collections.Counter()
+        self.hooks = {event: [] for event in self.EVENTS}
+        self.start_time = None
+
+    def add_hook(self, event, callback):
+        """Call callback(node) at every event of the given kind."""
+        if event not in self.hooks:
+            raise ValueError("event must be one of " + ", ".join(self.EVENTS) + ".")
+        self.hooks[event].append(callback)
+
+    def timer(self, fn, name):
+        """Return fn, adding the time spent in its calls to timings[name]."""
+        timings = self.timings
+
+        def timed_fn(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings[name] += time.perf_counter() - start
+        return timed_fn
+
+    def begin(self, problem):
+        """Start timing a search of problem. Return the problem to search:
+        problem itself, or a TimedProblem if timed."""
+        self.start_time = time.perf_counter()
+        return TimedProblem(problem, self) if self.timed else problem
+
+    def end(self, node):
+        """Stop timing a search that returned node (a goal or None)."""
+        self.elapsed += time.perf_counter() - self.start_time
+        if node is not None:
+            for callback in self.hooks['goal']:
+                callback(node)
+        return node
+
+    def expand(self, node, children):
+        """Count the expansion of node into children."""
+        self.expanded += 1
+        self.generated += len(children)
+        for callback in self.hooks['expand']:
+            callback(node)
+        for callback in self.hooks['generate']:
+            for child in children:
+                callback(child)
+
+    def duplicate(self, node):
+        """Count a child dropped as a duplicate."""
+        self.duplicates += 1
+        for callback in self.hooks['duplicate']:
+            callback(node)
+
+    def reopen(self, node):
+        """Count a frontier node replaced by the cheaper node."""
+        self.reopened += 1
+        for callback in self.hooks['reopen']:
+            callback(node)
+
+    def frontier_size(self, size):
+        """Record the size of the frontier."""
+        if size > self.frontier_max:
+            self.frontier_max = size
+
+    def as_dict(self):
+        """Return the statistics as a dictionary."""
+        return dict(expanded=self.expanded, generated=self.generated,
+                    duplicates=self.duplicates, reopened=self.reopened,
+                    frontier_max=self.frontier_max, elapsed=self.elapsed,
+                    timings=dict(self.timings), counters=dict(self.counters))
+
+
+class CancellationToken:
+    """A flag that another thread (or a signal handler) sets to stop a
+    search given a SearchBudget with this token."""
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        """Ask the searches using this token to stop."""
+        self.cancelled = True
+
+
+class SearchBudget:
+    """Limits of a search, checked by the search functions that take a
+    budget argument before every expansion:
+        max_nodes: maximum number of nodes expanded (None for no limit)
+        deadline: time.perf_counter() value after which the search stops
+            (None for no limit). The clock is only read every
+            check_interval expansions.
+        token: a CancellationToken (None for no cancellation)
+    A search that runs out of budget returns a BudgetExhausted instead of
+    a node. expanded counts the expansions of every search given this
+    budget, so a budget can be shared by successive searches."""
+
+    def __init__(self, max_nodes=None, deadline=None, token=None, check_interval=64):
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.token = token
+        self.check_interval = check_interval
+        self.expanded = 0
+
+    def exhausted(self):
+        """Return the reason why the search has to stop before its next
+        expansion ('nodes', 'deadline' or 'cancelled'), or None after
+        counting the expansion."""
+        if self.max_nodes is not None and self.expanded >= self.max_nodes:
+            return 'nodes'
+        if self.token is not None and self.token.cancelled:
+            return 'cancelled'
+        if self.deadline is not None and self.expanded % self.check_interval == 0 \
+                and time.perf_counter() >= self.deadline:
+            return 'deadline'
+        self.expanded += 1
+        return None
+
+
+class BudgetExhausted:
+    """Result of a search stopped by its SearchBudget.
+        reason: 'nodes', 'deadline' or 'cancelled'
+        expanded: number of nodes expanded under the budget
+        bound: f value of the node that was about to be expanded (for A*
+            with an admissible h, a lower bound on the cost of any
+            solution), None if the search has no such value
+        stats: the SearchStats of the search, None if it was not given one"""
+
+    def __init__(self, reason, budget, bound=None, stats=None):
+        self.reason = reason
+        self.expanded = budget.expanded
+        self.bound = bound
+        self.stats = stats
+        if stats is not None:
+            stats.end(None)
+
+    def __repr__(self):
+        return '<BudgetExhausted {} after {} expansions>'.format(self.reason, self.expanded)
+
+
+class SearchCheckpoint:
+    """On-disk snapshots of a best_first_graph_search (or A* search), to
+    resume it after a crash or a pre-emption.
+    The search given a checkpoint saves a snapshot to path every interval
+    seconds (the clock is read every check_interval expansions) and when
+    its budget runs out, and deletes it when it finishes. If the file
+    exists when the search starts, the search resumes from it instead of
+    starting from problem.initial, and returns the same node as a search
+    that was never interrupted.
+    A snapshot holds the frontier (in an order that rebuilds the same
+    queue), the explored states, and the nodes on the paths to the
+    frontier nodes as a table of (state, parent row, action, path cost)
+    rows. The states and actions must be picklable."""
+
+    def __init__(self, path, interval=300.0, check_interval=1000):
+        self.path = path
+        self.interval = interval
+        self.check_interval = check_interval
+        self.expansions = 0
+        self.last_save = time.perf_counter()
+
+    def due(self):
+        """Count an expansion. Return True if a snapshot should be saved."""
+        self.expansions += 1
+        return self.expansions % self.check_interval == 0 and \
+            time.perf_counter() - self.last_save >= self.interval
+
+    def save(self, problem, frontier_nodes, explored):
+        """Write a snapshot of a search of problem (atomically)."""
+        rows = []
+        row_of = {}  # id(node) -> row of the node in rows
+        frontier = []
+        for node in frontier_nodes:
+            # Add the ancestors that are not in the table yet, root first
+            path = []
+            ancestor = node
+            while ancestor is not None and id(ancestor) not in row_of:
+                path.append(ancestor)
+                ancestor = ancestor.parent
+            for n in reversed(path):
+                row_of[id(n)] = len(rows)
+                rows.append((n.state, -1 if n.parent is None else row_of[id(n.parent)],
+                             n.action, n.path_cost))
+            frontier.append(row_of[id(node)])
+        snapshot = {'initial': problem.initial, 'rows': rows,
+                    'frontier': frontier, 'explored': explored}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.perf_counter()
+
+    def load(self, problem):
+        """Return (frontier nodes, explored states) of the snapshot, or
+        None if there is none. Raises ValueError if the snapshot is of a
+        problem with another initial state."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot['initial'] != problem.initial:
+            raise ValueError('the checkpoint {} is of another problem'.format(self.path))
+        nodes = []
+        for state, parent, action, path_cost in snapshot['rows']:
+            nodes.append(Node(state, None if parent < 0 else nodes[parent], action, path_cost))
+        return [nodes[row] for row in snapshot['frontier']], snapshot['explored']
+
+    def remove(self):
+        """Delete the snapshot, if any."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ExpansionTracer:
+    """Write one record per node expansion to a trace file.
+    Attach it to the SearchStats given to a search (see attach). A record
+    holds t (seconds since the tracer was created), g, h and f (None if
+    the search did not compute h), the depth of the node, and the fields
+    returned by fields(node) if given (e.g. the box pushed to reach it).
+    format is
+        'jsonl': one JSON object per line, or
+        'chrome': a Chrome trace (chrome://tracing, Perfetto) of instant
+            'expand' events with the record as args and ts in microseconds.
+    The records are buffered and written buffer_size at a time, and at
+    most max_records are written (the others are only counted in dropped),
+    so the I/O of a long search is bounded. The nodes are only read, so
+    tracing does not change the result of the search.
+    Call close() when done, or use the tracer as a context manager."""
+
+    def __init__(self, path, format='jsonl', fields=None, buffer_size=1000, max_records=None):
+        if format not in ('jsonl', 'chrome'):
+            raise ValueError("format must be either 'jsonl' or 'chrome'.")
+        self.format = format
+        self.fields = fields
+        self.buffer_size = buffer_size
+        self.max_records = max_records
+        self.buffer = []
+        self.written = 0
+        self.dropped = 0
+        self.start_time = time.perf_counter()
+        self.file = open(path, 'w')
+        if format == 'chrome':
+            self.file.write('[\n')
+
+    def attach(self, stats):
+        """Record the expansions counted by stats. Return stats."""
+        stats.add_hook('expand', self.record)
+        return stats
+
+    def record(self, node):
+        """Add the record of an expanded node."""
+        if self.max_records is not None and self.written + len(self.buffer) >= self.max_records:
+            self.dropped += 1
+            return
+        t = time.perf_counter() - self.start_time
+        h = getattr(node, 'h', None)
+        record = {'g': node.path_cost, 'h': h, 'f': None if h is None else node.path_cost + h,
+                  'depth': node.depth}
+        if self.fields is not None:
+            record.update(self.fields(node))
+        if self.format == 'jsonl':
+            record['t'] = round(t, 6)
+        else:
+            record = {'name': 'expand', 'ph': 'i', 's': 't', 'pid': 1, 'tid': 1,
+                      'ts': round(t * 1e6), 'args': record}
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records."""
+        if not self.buffer:
+            return
+        separator = '\n' if self.format == 'jsonl' else ',\n'
+        if self.format == 'chrome' and self.written:
+            self.file.write(separator)
+        self.file.write(separator.join(json.dumps(record, separators=(',', ':'))
+                                       for record in self.buffer))
+        if self.format == 'jsonl':
+            self.file.write('\n')
+        self.written += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """Write the buffered records and close the file."""
+        self.flush()
+        if self.format == 'chrome':
+            self.file.write('\n]\n')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TimedProblem(Problem):
+    """A view of a problem that adds the time spent in its actions, result,
+    path_cost, goal_test and successors methods to stats.timings.
+    The calls that successors makes to the other methods (e.g. those of
+    the default Problem.successors) are timed as part of successors.
+    Every other attribute is the one of the problem."""
+
+    def __init__(self, problem, stats):
+        self.problem = problem
+        for name in ('actions', 'result', 'path_cost', 'goal_test'):
+            setattr(self, name, stats.timer(getattr(problem, name), name))
+        # successors may be a generator: time the whole iteration
+        successors = problem.successors
+        self.successors = stats.timer(lambda state: list(successors(state)), 'successors')
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+#______________________________________________________________________________
+
 # Uninformed Search algorithms
 
-def tree_search(problem, frontier):
+def tree_search(problem, frontier, stats=None, budget=None):
     """
         Search through the successors of a problem to find a goal.
         The argument frontier should be an empty queue.
         Don't worry about repeated paths to a state. [Fig. 3.7]
+        If stats is a SearchStats, it is filled in during the search.
+        If budget is a SearchBudget, a BudgetExhausted is returned when
+        it runs out.
         Return
              the node of the first goal state found
              or None is no goal state is found
     """
     assert isinstance(problem, Problem)
+    if stats is not None:
+        problem = stats.begin(problem)
     frontier.append(Node(problem.initial))
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
-            return node
-        frontier.extend(node.expand(problem))
-    return None
-
-
-def graph_search(problem, frontier):
+            return node if stats is None else stats.end(node)
+        if budget is not None:
+            reason = budget.exhausted()
+            if reason is not None:
+                return BudgetExhausted(reason, budget, None, stats)
+        children = node.expand(problem)
+        frontier.extend(children)
+        if stats is not None:
+            stats.expand(node, children)
+            stats.frontier_size(len(frontier))
+    return None if stats is None else stats.end(None)
+
+
+def graph_search(problem, frontier, stats=None, budget=None):
     """
     Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
     If two paths reach a state, only use the first one. [Fig. 3.7]
+    If stats is a SearchStats, it is filled in during the search.
+    If budget is a SearchBudget, a BudgetExhausted is returned when
+    it runs out.
     Return
         the node of the first goal state found
         or None is no goal state is found
     """
     assert isinstance(problem, Problem)
+    if stats is not None:
+        problem = stats.begin(problem)
     frontier.append(Node(problem.initial))
     explored = set() # initial empty set of explored states
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
-            return node
+            return node if stats is None else stats.end(node)
+        if budget is not None:
+            reason = budget.exhausted()
+            if reason is not None:
+                return BudgetExhausted(reason, budget, None, stats)
         explored.add(node.state)
-        # Python note: next line uses of a generator
-        frontier.extend(child for child in node.expand(problem)
-                        if child.state not in explored
-                        and child not in frontier)
-    return None
+        if stats is None:
+            # Python note: next line uses of a generator
+            frontier.extend(child for child in node.expand(problem)
+                            if child.state not in explored
+                            and child not in frontier)
+            continue
+        children = node.expand(problem)
+        stats.expand(node, children)
+        for child in children:
+            if child.state not in explored and child not in frontier:
+                frontier.append(child)
+            else:
+                stats.duplicate(child)
+        stats.frontier_size(len(frontier))
+    return None if stats is None else stats.end(None)
 
 
 def breadth_first_tree_search(problem):
@@ -358,23 +1000,35 @@ def breadth_first_graph_search(problem):
 
 # Informed Search algorithms
 
-def best_first_tree_search(problem, f):
+def best_first_tree_search(problem, f, stats=None, budget=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
+    If stats is a SearchStats, it is filled in during the search.
+    If budget is a SearchBudget, a BudgetExhausted is returned when
+    it runs out.
     """
+    if stats is not None:
+        problem = stats.begin(problem)
     node = Node(problem.initial)
     if problem.goal_test(node.state):
-        return node
+        return node if stats is None else stats.end(node)
     frontier = PriorityQueue(f=f)
     frontier.append(node)
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
-            return node
-        for child in node.expand(problem):
+            return node if stats is None else stats.end(node)
+        if budget is not None:
+            reason = budget.exhausted()
+            if reason is not None:
+                return BudgetExhausted(reason, budget, f(node), stats)
+        children = node.expand(problem)
+        if stats is not None:
+            stats.expand(node, children)
+        for child in children:
             # test whether a node with the same state
             # exists in the frontier
             if child not in frontier:
@@ -386,29 +1040,75 @@ def best_first_tree_search(problem, f):
                     # replace the incumbent with child
                     del frontier[child]
                     frontier.append(child)
-    return None
+                    if stats is not None:
+                        stats.reopen(child)
+                elif stats is not None:
+                    stats.duplicate(child)
+        if stats is not None:
+            stats.frontier_size(len(frontier))
+    return None if stats is None else stats.end(None)
 
 
 
-def best_first_graph_search(problem, f):
+def best_first_graph_search(problem, f, frontier_factory=None, stats=None, budget=None,
+                            checkpoint=None):
     """
     Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
+    The frontier is built by frontier_factory(f=f, key=...) and is keyed by
+    state, so the duplicate checks below are hash lookups instead of linear
+    scans. The default is an IndexedPriorityQueue; when f only takes small
+    integer values a BucketPriorityQueue can be used instead, e.g.
+        functools.partial(BucketPriorityQueue, tie_break='high_g')
+    If stats is a SearchStats, it is filled in during the search.
+    If budget is a SearchBudget, a BudgetExhausted is returned when
+    it runs out.
+    If checkpoint is a SearchCheckpoint, the search is resumed from its
+    snapshot if there is one, and saves snapshots as it goes. The snapshots
+    list the frontier with its items() method, so a ValueError is raised
+    if it has none (e.g. PriorityQueue).
     """
+    if stats is not None:
+        problem = stats.begin(problem)
     node = Node(problem.initial)
     if problem.goal_test(node.state):
-        return node
-    frontier = PriorityQueue(f=f)
-    frontier.append(node)
-    explored = set() # set of states
+        # A snapshot left by another run is stale
+        if checkpoint is not None:
+            checkpoint.remove()
+        return node if stats is None else stats.end(node)
+    frontier_factory = frontier_factory or IndexedPriorityQueue
+    frontier = frontier_factory(f=f, key=lambda node: node.state)
+    if checkpoint is not None and not hasattr(frontier, 'items'):
+        # Fail now rather than at the first snapshot
+        raise ValueError("checkpoint needs a frontier with an items() method, "
+                         "such as IndexedPriorityQueue or BucketPriorityQueue.")
+    snapshot = None if checkpoint is None else checkpoint.load(problem)
+    if snapshot is None:
+        frontier.append(node)
+        explored = set() # set of states
+    else:
+        nodes, explored = snapshot
+        frontier.extend(nodes)
     while frontier:
         node = frontier.pop()
         if problem.goal_test(node.state):
-            return node
+            if checkpoint is not None:
+                checkpoint.remove()
+            return node if stats is None else stats.end(node)
+        if budget is not None:
+            reason = budget.exhausted()
+            if reason is not None:
+                if checkpoint is not None:
+                    frontier.append(node)
+                    checkpoint.save(problem, frontier.items(), explored)
+                return BudgetExhausted(reason, budget, f(node), stats)
         explored.add(node.state)
-        for child in node.expand(problem):
+        children = node.expand(problem)
+        if stats is not None:
+            stats.expand(node, children)
+        for child in children:
             if child.state not in explored and child not in frontier:
                 frontier.append(child)
             elif child in frontier:
@@ -418,7 +1118,19 @@ def best_first_graph_search(problem, f):
                 if f(child) < frontier[child]:
                     del frontier[child] # delete the incumbent node
                     frontier.append(child) # 
-    return None
+                    if stats is not None:
+                        stats.reopen(child)
+                elif stats is not None:
+                    stats.duplicate(child)
+            elif stats is not None:
+                stats.duplicate(child)
+        if stats is not None:
+            stats.frontier_size(len(frontier))
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(problem, frontier.items(), explored)
+    if checkpoint is not None:
+        checkpoint.remove()
+    return None if stats is None else stats.end(None)
 
 
 def uniform_cost_search(problem):
@@ -463,20 +1175,437 @@ def iterative_deepening_search(problem):
 greedy_best_first_graph_search = best_first_graph_search
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
 
-def astar_graph_search(problem, h=None):
+def astar_graph_search(problem, h=None, frontier_factory=None, stats=None, budget=None,
+                       checkpoint=None):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
+    else in your Problem subclass.
+    frontier_factory, stats, budget and checkpoint are passed on to
+    best_first_graph_search."""
+    h = h or problem.h
+    if stats is not None and stats.timed:
+        h = stats.timer(h, 'h')
+    h = memoize(h, slot='h')
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n),
+                                   frontier_factory, stats, budget, checkpoint)
+
+
+def astar_tree_search(problem, h=None, stats=None, budget=None):
+    """A* search is best-first graph search with f(n) = g(n)+h(n).
+    You need to specify the h function when you call astar_search, or
+    else in your Problem subclass.
+    stats and budget are passed on to best_first_tree_search."""
+    h = h or problem.h
+    if stats is not None and stats.timed:
+        h = stats.timer(h, 'h')
+    h = memoize(h, slot='h')
+    return best_first_tree_search(problem, lambda n: n.path_cost + h(n), stats, budget)
+
+
+def idastar_search(problem, h=None, table_size=100000, budget=None):
+    """Iterative deepening A* search.
+    Depth-first searches bounded by f(n) = g(n)+h(n), where the bound of each
+    iteration is the smallest f value that exceeded the previous bound.
+    With an admissible h the first goal found is optimal.
+    Only the current path and the siblings of its nodes are kept, on an
+    explicit stack instead of the recursion of the textbook version.
+    A transposition table of at most table_size states (least recently
+    updated ones evicted first) maps each state to the lowest g it was
+    reached with in the current iteration, so that a state is not searched
+    again through a path that is not cheaper. It also cuts the cycles.
+    If budget is a SearchBudget, a BudgetExhausted (whose bound is the
+    bound of the current iteration) is returned when it runs out.
+    Return the goal node, or None if there is no solution."""
     h = memoize(h or problem.h, slot='h')
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n))
+    f = lambda n: n.path_cost + h(n)
+    root = Node(problem.initial)
+    bound = f(root)
+    while bound < float('inf'):
+        next_bound = float('inf')
+        table = collections.OrderedDict([(root.state, 0)])
+        stack = [iter([root])]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                continue
+            if f(node) > bound:
+                next_bound = min(next_bound, f(node))
+                continue
+            if problem.goal_test(node.state):
+                return node
+            if budget is not None:
+                reason = budget.exhausted()
+                if reason is not None:
+                    return BudgetExhausted(reason, budget, bound)
+            children = []
+            for child in node.expand(problem):
+                g = table.get(child.state)
+                if g is not None and g <= child.path_cost:
+                    continue
+                table[child.state] = child.path_cost
+                table.move_to_end(child.state)
+                if len(table) > table_size:
+                    table.popitem(last=False)
+                children.append(child)
+            # Search the most promising children first
+            children.sort(key=f)
+            stack.append(iter(children))
+        bound = next_bound
+    return None
 
 
-def astar_tree_search(problem, h=None):
-    """A* search is best-first graph search with f(n) = g(n)+h(n).
-    You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
+def _hdastar_worker(index, problem, h, inboxes, replies, incumbent, sent, received, idle, batch_size,
+                    expansions):
+    """One process of hdastar_search.
+    Owns the states s with hash(s) % len(inboxes) == index: their open list,
+    and their lowest path cost with the parent state and action it was
+    reached by (the closed list). Children owned by other processes are sent
+    to their inboxes in batches. The numbers of nodes expanded and generated
+    are kept in expansions[2 * index] and expansions[2 * index + 1]."""
+    workers = len(inboxes)
+    frontier = IndexedPriorityQueue(f=lambda n: n.path_cost + h(n), key=lambda n: n.state)
+    best = {}  # state -> (path cost, parent state, action)
+    goal = None  # (path cost, state) of the best goal owned by this process
+    outboxes = [[] for _ in range(workers)]
+    parent_process = multiprocessing.parent_process()
+
+    def receive(state, cost, parent, action):
+        nonlocal goal
+        if state in best and best[state][0] <= cost:
+            return
+        best[state] = (cost, parent, action)
+        if problem.goal_test(state):
+            # Goals are never expanded: they update the shared incumbent
+            if goal is None or cost < goal[0]:
+                goal = (cost, state)
+            with incumbent.get_lock():
+                incumbent.value = min(incumbent.value, cost)
+        else:
+            frontier.append(Node(state, path_cost=cost))
+
+    while True:
+        # Children and requests from the other processes; wait for them when idle
+        try:
+            message = inboxes[index].get(block=idle[index], timeout=0.01)
+        except queue.Empty:
+            # Do not outlive a search that was killed
+            if not parent_process.is_alive():
+                # Nobody will read the batches still buffered for the other processes
+                for inbox in inboxes:
+                    inbox.cancel_join_thread()
+                return
+            message = None
+        if message is not None:
+            if message[0] == 'children':
+                idle[index] = 0
+                with received.get_lock():
+                    received.value += 1
+                for child in message[1]:
+                    receive(*child)
+            elif message[0] == 'goal':
+                replies.put(goal)
+            elif message[0] == 'parent':
+                replies.put(best[message[1]])
+            else:  # 'stop'
+                return
+            continue
+
+        # Expand a batch of nodes cheaper than the incumbent
+        for _ in range(batch_size):
+            if not frontier:
+                break
+            node = frontier.pop()
+            if frontier.f(node) >= incumbent.value:
+                # No node left here can lead to a cheaper goal
+                frontier = IndexedPriorityQueue(f=frontier.f, key=lambda n: n.state)
+                break
+            children = node.expand(problem)
+            expansions[2 * index] += 1
+            expansions[2 * index + 1] += len(children)
+            for child in children:
+                owner = hash(child.state) % workers
+                if owner == index:
+                    receive(child.state, child.path_cost, node.state, child.action)
+                else:
+                    outboxes[owner].append((child.state, child.path_cost, node.state, child.action))
+
+        for owner, batch in enumerate(outboxes):
+            if batch:
+                # Count the batch before sending it so that it is never both
+                # in transit and missing from the counters
+                with sent.get_lock():
+                    sent.value += 1
+                inboxes[owner].put(('children', batch))
+                outboxes[owner] = []
+        if not frontier:
+            idle[index] = 1
+
+
+def fork_context():
+    """Return the 'fork' multiprocessing context, or None where forking is
+    not available (Windows) or not safe (macOS, where the system libraries
+    may be left in a broken state in the child process)."""
+    if sys.platform == 'darwin' or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def hdastar_search(problem, h=None, workers=None, batch_size=64, budget=None, reply_timeout=1.0,
+                   stats=None):
+    """Hash-distributed A* search (HDA*) over a pool of processes.
+    Every state is owned by the process hash(state) % workers, which keeps
+    its open and closed lists: generated children are sent to their owners
+    in batches. A goal reached at cost c becomes the incumbent once it is
+    the cheapest one, and the nodes with f >= c are not expanded.
+    The search ends when every process is idle and every batch sent has
+    been received. With an admissible h the incumbent is then optimal.
+    The processes are forked, so the problem and h need not be picklable
+    but the states and actions must be (and hash the same in every process).
+    Side effects of the search on problem stay in the worker processes.
+    Where forking is not available or not safe (see fork_context), the
+    search runs astar_graph_search in this process instead, which also
+    enforces the node limit of budget.
+    workers defaults to the number of CPUs. While the solution is collected,
+    the processes are checked every reply_timeout seconds.
+    If budget is a SearchBudget, its deadline and token stop the search
+    with a BudgetExhausted; its node limit is not enforced.
+    If stats is a SearchStats, the nodes expanded and generated by all the
+    processes are added to it, with the elapsed time. The other counters,
+    the timings and the hooks other than 'goal' are left alone, as they
+    would be filled in the worker processes.
+    Return a goal node whose path can be followed with node.path() or
+    node.solution(), or None if there is no solution.
+    A RuntimeError is raised if a process dies during the search."""
     h = memoize(h or problem.h, slot='h')
-    return best_first_tree_search(problem, lambda n: n.path_cost + h(n))
+    if problem.goal_test(problem.initial):
+        return Node(problem.initial)
+    context = fork_context()
+    if context is None:
+        return astar_graph_search(problem, h, stats=stats, budget=budget)
+    if stats is not None:
+        stats.begin(problem)
+    workers = workers or multiprocessing.cpu_count()
+    inboxes = [context.Queue() for _ in range(workers)]
+    replies = context.Queue()
+    incumbent = context.Value('d', float('inf'))
+    sent, received = context.Value('l', 0), context.Value('l', 0)
+    idle = context.Array('b', [1] * workers)
+    # Only written by the process owning the slots, so no lock is needed
+    expansions = context.RawArray('l', 2 * workers)
+    processes = [context.Process(target=_hdastar_worker,
+                                 args=(i, problem, h, inboxes, replies, incumbent,
+                                       sent, received, idle, batch_size, expansions),
+                                 daemon=True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    def reply(owner):
+        # Wait for the answer of a process as long as it is alive
+        while True:
+            try:
+                return replies.get(timeout=reply_timeout)
+            except queue.Empty:
+                if not processes[owner].is_alive():
+                    raise RuntimeError('a search process died')
+
+    try:
+        sent.value = 1
+        inboxes[hash(problem.initial) % workers].put(
+            ('children', [(problem.initial, 0, None, None)]))
+
+        # Termination: all idle and no batch in transit, with the counters
+        # unchanged while the idle flags were read
+        while True:
+            time.sleep(0.001)
+            if not all(process.is_alive() for process in processes):
+                raise RuntimeError('a search process died')
+            if budget is not None:
+                if budget.token is not None and budget.token.cancelled:
+                    return BudgetExhausted('cancelled', budget, stats=stats)
+                if budget.deadline is not None and time.perf_counter() >= budget.deadline:
+                    return BudgetExhausted('deadline', budget, stats=stats)
+            counts = sent.value, received.value
+            if counts[0] == counts[1] and all(idle) and counts == (sent.value, received.value):
+                break
+
+        # Collect the best goal, then follow the parent links through their owners
+        goals = []
+        for owner, inbox in enumerate(inboxes):
+            inbox.put(('goal',))
+            goals.append(reply(owner))
+        goals = [goal for goal in goals if goal is not None]
+        if not goals:
+            return None if stats is None else stats.end(None)
+        cost, state = min(goals, key=lambda goal: goal[0])
+        path = []
+        while state is not None:
+            owner = hash(state) % workers
+            inboxes[owner].put(('parent', state))
+            cost, parent, action = reply(owner)
+            path.append((state, cost, action))
+            state = parent
+        node = None
+        for state, cost, action in reversed(path):
+            node = Node(state, node, action, cost)
+        return node if stats is None else stats.end(node)
+    finally:
+        for inbox in inboxes:
+            inbox.put(('stop',))
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        if stats is not None:
+            stats.expanded += sum(expansions[0::2])
+            stats.generated += sum(expansions[1::2])
+
+
+def arastar_search(problem, h=None, epsilon=3.0, step=0.5, deadline=None):
+    """Anytime Repairing A* (ARA*, Likhachev et al. 2003).
+    A generator of (node, bound) pairs: each node is a goal node cheaper
+    than the previous one, or the same node with a tighter bound, and its
+    cost is at most bound times the optimal cost.
+    Weighted A* searches with f(n) = g(n) + w*h(n) are run for
+    w = epsilon, epsilon - step, ..., 1. Each search reuses the work of the
+    previous one: the frontier is kept, and only the states whose g
+    decreased after they were expanded (the inconsistent states) are
+    expanded again.
+    The generator stops after proving optimality (bound 1.0), when there is
+    no solution (nothing is yielded), or when time.perf_counter() passes
+    deadline (if not None). A goal found by the interrupted search is still
+    yielded, with the bound g(goal) / the lowest f = g + h of the
+    unexpanded nodes, capped by the weight of the last completed search.
+    If the deadline passes before any goal is found, (None, inf) is
+    yielded last, so that running out of time is not mistaken for there
+    being no solution."""
+    h = memoize(h or problem.h, slot='h')
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        yield root, 1.0
+        return
+    best = {root.state: root}  # state -> node with the lowest g found so far
+    open_nodes = [root]
+    incons = {}  # state -> node of the inconsistent states
+    incumbent = None
+    last = (None, float('inf'))
+    weight = epsilon
+    completed_weight = float('inf')  # weight of the last search that ran to the end
+    while True:
+        # Improve the path with weight w
+        frontier = IndexedPriorityQueue(f=lambda n, w=weight: n.path_cost + w * h(n),
+                                        key=lambda n: n.state)
+        frontier.extend(open_nodes)
+        closed = set()
+        timed_out = False
+        while frontier:
+            if deadline is not None and time.perf_counter() > deadline:
+                timed_out = True
+                break
+            node = frontier.pop()
+            if incumbent is not None and node.path_cost + weight * h(node) >= incumbent.path_cost:
+                frontier.append(node)
+                break
+            closed.add(node.state)
+            for child in node.expand(problem):
+                previous = best.get(child.state)
+                if previous is not None and previous.path_cost <= child.path_cost:
+                    continue
+                best[child.state] = child
+                if problem.goal_test(child.state):
+                    if incumbent is None or child.path_cost < incumbent.path_cost:
+                        incumbent = child
+                elif child.state in closed:
+                    incons[child.state] = child
+                else:
+                    frontier.append(child)
+        open_nodes = frontier.items() + list(incons.values())
+        incons = {}
+        if incumbent is None:
+            if timed_out:
+                yield None, float('inf')
+            return
+        if not timed_out:
+            completed_weight = weight
+
+        # Suboptimality bound: g(goal) / the lowest f = g + h of the unexpanded nodes
+        lowest_f = min((n.path_cost + h(n) for n in open_nodes), default=float('inf'))
+        ratio = incumbent.path_cost / lowest_f if lowest_f > 0 else float('inf')
+        bound = max(1.0, min(completed_weight, ratio))
+        if incumbent is not last[0] or bound < last[1]:
+            last = (incumbent, bound)
+            yield incumbent, bound
+        if bound <= 1.0 or timed_out:
+            return
+        weight = max(1.0, weight - step)
+
+
+def bidirectional_astar_search(problem, backward, h=None, h_backward=None, budget=None):
+    """Bidirectional A* search.
+    A forward A* search from problem.initial and a backward A* search from
+    the states of backward.initial run in turns, the side with the smaller
+    frontier expanding next. backward is a Problem over the same states:
+        backward.initial is a list of states from which a goal of problem
+            is reached at no further cost (e.g. its goal states),
+        the successors of a state in backward are its predecessors in
+            problem, with the same step costs.
+    h estimates the cost from a node to a goal, h_backward the cost from
+    problem.initial to a node of the backward search. Both must be
+    admissible.
+    A state reached by both searches gives a solution of cost
+    g_forward + g_backward. The best one, mu, is optimal as soon as a
+    node with f >= mu is popped from either frontier.
+    Return (node, backward_node), where node is a node of the forward
+    search and backward_node a node of the backward search with the same
+    state (None if node is a goal of problem), or None if there is no
+    solution. The cost of the solution is the sum of their path costs.
+    If budget is a SearchBudget, a BudgetExhausted is returned when it
+    runs out."""
+    h = memoize(h or problem.h, slot='h')
+    h_backward = memoize(h_backward or backward.h, slot='h')
+    problems = (problem, backward)
+    frontiers = (IndexedPriorityQueue(f=lambda n: n.path_cost + h(n), key=lambda n: n.state),
+                 IndexedPriorityQueue(f=lambda n: n.path_cost + h_backward(n), key=lambda n: n.state))
+    best = ({}, {})  # per side: state -> node with the lowest g found so far
+    mu, meeting = float('inf'), None
+
+    root = Node(problem.initial)
+    if problem.goal_test(root.state):
+        return root, None
+    best[0][root.state] = root
+    frontiers[0].append(root)
+    for state in backward.initial:
+        node = Node(state)
+        best[1][state] = node
+        frontiers[1].append(node)
+        if state == root.state:
+            mu, meeting = 0, (root, node)
+
+    while frontiers[0] and frontiers[1]:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        frontier = frontiers[side]
+        node = frontier.pop()
+        if frontier.f(node) >= mu:
+            break
+        if budget is not None:
+            reason = budget.exhausted()
+            if reason is not None:
+                return BudgetExhausted(reason, budget)
+        for child in node.expand(problems[side]):
+            previous = best[side].get(child.state)
+            if previous is not None and previous.path_cost <= child.path_cost:
+                continue
+            best[side][child.state] = child
+            frontier.append(child)
+            # Does the child connect the two searches?
+            if side == 0 and child.path_cost < mu and problem.goal_test(child.state):
+                mu, meeting = child.path_cost, (child, None)
+            other = best[1 - side].get(child.state)
+            if other is not None and child.path_cost + other.path_cost < mu:
+                mu = child.path_cost + other.path_cost
+                meeting = (child, other) if side == 0 else (other, child)
+    return meeting
 
 #______________________________________________________________________________
 #
@@ -0,0 +1,431 @@
+'''
+
+Unit tests of mySokobanSolver.py, run with pytest from this directory.
+
+'''
+
+import itertools
+import json
+import random
+
+import pytest
+
+import mySokobanSolver as solver
+import search
+
+
+# Boxes of weights 3, 1 and 3 in reading order
+WEIGHTED_LINES = ['3 1 3',
+                  '#######',
+                  '#@ $  #',
+                  '# $ $ #',
+                  '#.. . #',
+                  '#######']
+
+
+def test_sokoban_state_orders_boxes_by_weight(from_lines):
+    wh = from_lines(WEIGHTED_LINES)
+    puzzle = solver.SokobanPuzzle(wh)
+    assert puzzle.weights == (1, 3, 3)
+    assert puzzle.box_groups == [(0, 1), (1, 3), (1, 3)]
+    state = puzzle.initial
+    assert isinstance(state, solver.SokobanState) and state.worker == wh.worker
+    # The weight 1 box first, then the boxes of weight 3 sorted
+    assert state.boxes == ((2, 2), (3, 1), (4, 2))
+    assert sorted(zip(state.boxes, puzzle.weights)) == sorted(zip(wh.boxes, wh.weights))
+
+    # Swapping two boxes of equal weight gives the same state, others do not
+    assert puzzle.move_box(state.boxes, 2, (2, 1)) == ((2, 2), (2, 1), (3, 1))
+    assert puzzle.move_box(state.boxes, 0, (5, 2)) == ((5, 2), (3, 1), (4, 2))
+    swapped = solver.SokobanPuzzle(wh.copy(boxes=[wh.boxes[2], wh.boxes[1], wh.boxes[0]]))
+    assert swapped.initial == state and hash(swapped.initial) == hash(state)
+
+
+def test_sokoban_state_to_warehouse(from_lines):
+    wh = from_lines(WEIGHTED_LINES)
+    puzzle = solver.SokobanPuzzle(wh)
+    state = puzzle.result(puzzle.initial, 'Right')
+    assert state.worker == (2, 1) and state.boxes == puzzle.initial.boxes
+    # Pushing the box of weight 1 costs 1 + 1
+    pushed = puzzle.result(state, 'Down')
+    assert pushed.boxes == ((2, 3), (3, 1), (4, 2))
+    assert puzzle.path_cost(0, state, 'Down', pushed) == 2
+    rendered = puzzle.to_warehouse(state)
+    assert rendered.worker == (2, 1)
+    assert sorted(zip(rendered.boxes, rendered.weights)) == sorted(zip(wh.boxes, wh.weights))
+    assert solver.SokobanPuzzle(rendered).initial == state
+
+
+def test_bitboard_backend_matches_tuple_backend(load):
+    for name in ['035', '147']:
+        wh = load(name)
+        puzzles = [solver.SokobanPuzzle(wh), solver.BitboardSokobanPuzzle(wh)]
+        rng = random.Random(0)
+        states = [puzzle.initial for puzzle in puzzles]
+        for _ in range(300):
+            tuple_state, bit_state = states
+            assert puzzles[1].to_pos(bit_state.worker) == tuple_state.worker
+            assert sorted(puzzles[1].weighted_boxes(bit_state)) == sorted(puzzles[0].weighted_boxes(tuple_state))
+            assert puzzles[1].goal_test(bit_state) == puzzles[0].goal_test(tuple_state)
+            actions = [puzzle.actions(state) for puzzle, state in zip(puzzles, states)]
+            assert actions[0] == actions[1]
+            if not actions[0]:
+                states = [puzzle.initial for puzzle in puzzles]
+                continue
+            action = rng.choice(actions[0])
+            next_states = [puzzle.result(state, action) for puzzle, state in zip(puzzles, states)]
+            costs = [puzzle.path_cost(0, state, action, next_state)
+                     for puzzle, state, next_state in zip(puzzles, states, next_states)]
+            assert costs[0] == costs[1]
+            states = next_states
+
+
+def test_bitboard_backend_finds_least_cost(load):
+    for name in ['001', '021', '031']:
+        expected = solver.solve_weighted_sokoban(load(name))[1]
+        assert solver.solve_weighted_sokoban(load(name), backend='bitboard', mode='step')[1] == expected
+    with pytest.raises(ValueError):
+        solver.solve_weighted_sokoban(load('001'), backend='bitboard')
+
+
+def test_push_distance_tables_match_forward_search(load):
+    for name in ['035', '147']:
+        wh = load(name)
+        walls = set(wh.walls)
+        tables = solver.push_distance_tables(walls, wh.targets, wh.nrows, wh.ncols)
+        assert tables.shape == (len(wh.targets), wh.nrows, wh.ncols)
+
+        def is_free(x, y):
+            return 0 <= x < wh.ncols and 0 <= y < wh.nrows and (x, y) not in walls
+
+        for y in range(wh.nrows):
+            for x in range(wh.ncols):
+                if not is_free(x, y):
+                    assert all(tables[:, y, x] == float('inf'))
+                    continue
+                # Push a lone box forward from (x,y): the worker stands behind it
+                distances = {(x, y): 0}
+                frontier = [(x, y)]
+                for bx, by in frontier:
+                    for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+                        if is_free(bx - dx, by - dy) and is_free(bx + dx, by + dy) and \
+                           (bx + dx, by + dy) not in distances:
+                            distances[bx + dx, by + dy] = distances[bx, by] + 1
+                            frontier.append((bx + dx, by + dy))
+                for t, target in enumerate(wh.targets):
+                    assert tables[t, y, x] == distances.get(target, float('inf'))
+
+
+def test_matching_heuristic_repair_matches_assignment_from_scratch(load):
+    wh = load('035')
+    wh.weights = [3, 0, 7, 1, 3]
+    puzzle = solver.SokobanPushPuzzle(wh)
+    assert len(wh.boxes) >= puzzle.matching_threshold
+    rng = random.Random(0)
+    node = search.Node(puzzle.initial)
+    repaired = 0
+    for _ in range(300):
+        repaired += node.parent is not None and node.parent.state.boxes in puzzle.matching_cache
+        cost = [[(1 + weight) * d for d in puzzle.target_push_distances[box]]
+                if box in puzzle.target_push_distances else [solver.INFEASIBLE_COST] * len(wh.targets)
+                for box, weight in puzzle.weighted_boxes(node.state)]
+        u, v, p = solver.min_cost_assignment(cost)
+        expected = sum(cost[p[j] - 1][j - 1] for j in range(1, len(cost) + 1))
+        if expected >= solver.INFEASIBLE_COST:
+            expected = float('inf')
+        assert puzzle.matching_heuristic(node) == expected
+        pushes = list(puzzle.successors(node.state))
+        if not pushes or expected == float('inf'):
+            node = search.Node(puzzle.initial)
+            continue
+        action, next_state, step_cost = rng.choice(pushes)
+        node = search.Node(next_state, node, action, node.path_cost + step_cost)
+    assert repaired > 100
+
+
+WALL_LINES = ['#########',
+              '#@    .##',
+              '#  $ $  #',
+              '#      .#',
+              '#########']
+
+
+def test_matching_deadlock_matches_exhaustive_assignment(load, from_lines):
+    def assignable(puzzle, boxes):
+        return any(all(t in puzzle.reachable_targets.get(box, ()) for box, t in zip(boxes, targets))
+                   for targets in itertools.permutations(range(len(puzzle.target_list))))
+
+    def valid(puzzle, match, boxes):
+        return match is not None and set(match) == set(boxes) and len(set(match.values())) == len(boxes) and \
+            all(t in puzzle.reachable_targets[box] for box, t in match.items())
+
+    deadlocks = 0
+    for wh in [load('035'), from_lines(WALL_LINES)]:
+        puzzle = solver.SokobanPushPuzzle(wh)
+        rng = random.Random(0)
+        state = puzzle.initial
+        for _ in range(200):
+            match = puzzle.box_matching(state.boxes, state.boxes)
+            assert (match is not None) == assignable(puzzle, state.boxes)
+            pushes = list(puzzle.successors(state)) if match is not None else []
+            for (box, _), next_state, _ in pushes:
+                new_box = (set(next_state.boxes) - set(state.boxes)).pop()
+                deadlock = puzzle.matching_deadlock(match, box, new_box, next_state.boxes)
+                assert deadlock != assignable(puzzle, next_state.boxes)
+                if not deadlock:
+                    assert valid(puzzle, puzzle.box_matchings[next_state.boxes], next_state.boxes)
+                deadlocks += deadlock
+            state = rng.choice(pushes)[1] if pushes else puzzle.initial
+    assert deadlocks > 0
+
+
+def test_matching_pruning_keeps_least_cost(from_lines):
+    expected = solver.solve_weighted_sokoban(from_lines(WALL_LINES))[1]
+    report = {}
+    plan, cost = solver.solve_weighted_sokoban(from_lines(WALL_LINES), matching=True, report=report)
+    assert cost == expected
+    assert report['matching'] > 0
+
+
+def test_deadlock_pattern_store_proves_patterns():
+    store = solver.DeadlockPatternStore()
+    # Box in a corner, two boxes along a wall and a 2x2 block of boxes
+    for pattern in ['## #$    ', '###$$    ', '$$ $$    ']:
+        assert store.prove(pattern)
+    # Box on a target in a corner, box in the open and box with a way out along the wall
+    for pattern in ['## #*    ', '    $    ', '### $    ']:
+        assert store.prove(pattern) is False
+
+    assert store.is_deadlock('## #$    ')
+    assert (store.hits, store.misses, store.learned) == (0, 1, 1)
+    # The rotations and reflections are found without a new proof
+    assert store.is_deadlock(' ## $#   ')
+    assert not store.is_deadlock('    $    ')
+    assert not store.is_deadlock('    $    ')
+    assert (store.hits, store.misses, store.learned) == (2, 2, 1)
+
+
+def test_deadlock_pattern_store_proves_undecided_patterns_again():
+    store = solver.DeadlockPatternStore(search_limit=0)
+    assert store.prove('## #$    ') is None
+    # Undecided patterns are not deadlocks, and not proven again with the same limit
+    assert not store.is_deadlock('## #$    ')
+    assert not store.is_deadlock(' ## $#   ')
+    assert (store.hits, store.misses, store.learned) == (1, 1, 0)
+    assert not store.safe and not store.deadlocks
+    store.search_limit = 2000
+    assert store.is_deadlock(' ## $#   ')
+    assert (store.hits, store.misses, store.learned) == (1, 2, 1)
+    assert not store.undecided
+
+
+def test_deadlock_pattern_store_json_round_trip(tmp_path):
+    path = str(tmp_path / 'patterns.json')
+    store = solver.DeadlockPatternStore(path)
+    assert not store.deadlocks
+    for pattern in ['## #$    ', ' ## $#   ', '$$ $$    ', '    $    ']:
+        store.is_deadlock(pattern)
+    store.save()
+    assert store.learned == 0
+    # One pattern per symmetry class is written
+    with open(path) as f:
+        assert len(json.load(f)['deadlocks']) == 2
+    loaded = solver.DeadlockPatternStore(path)
+    assert loaded.deadlocks == store.deadlocks
+    assert not loaded.safe
+    assert loaded.is_deadlock('    $# ##') and loaded.misses == 0
+
+
+def test_analyse_recognises_impossible_puzzles(load, from_lines):
+    impossible = {
+        # Box in a corner
+        'taboo': ['#######',
+                  '#$  . #',
+                  '#  @  #',
+                  '#######'],
+        # A box can only be pushed up into the alcove from a wall
+        'unreachable_target': ['#######',
+                               '#.#####',
+                               '# $$ .#',
+                               '#### @#',
+                               '#######'],
+        # The two boxes along the top wall can only reach the top target
+        'matching': ['#########',
+                     '#@ $ $ .#',
+                     '#  $   .#',
+                     '#      .#',
+                     '#########'],
+        # The box off target is stuck between the wall and the box on a target
+        'frozen': ['#########',
+                   '#@ $* . #',
+                   '#       #',
+                   '#########'],
+    }
+    for rule, lines in impossible.items():
+        assert solver.SokobanPuzzle(from_lines(lines)).analyse() == rule
+        report = {}
+        assert solver.solve_weighted_sokoban(from_lines(lines), report=report) == ('Impossible', None)
+        assert report['impossible'] == rule
+    for name in ['001', '035']:
+        assert solver.SokobanPushPuzzle(load(name)).analyse() is None
+
+
+def test_dead_squares_contain_taboo_cells(load):
+    for name in ['001', '035', '037', '059', '063', '099', '147', '183']:
+        wh = load(name)
+        # find_taboo_cells may also mark cells outside the warehouse,
+        # dead_squares only the cells the worker can walk to
+        free = {(x, y) for x in range(wh.ncols) for y in range(wh.nrows)} - set(wh.walls)
+        inside = {wh.worker}
+        frontier = [wh.worker]
+        for x, y in frontier:
+            for dx, dy in solver.deltas.values():
+                if (x + dx, y + dy) in free and (x + dx, y + dy) not in inside:
+                    inside.add((x + dx, y + dy))
+                    frontier.append((x + dx, y + dy))
+        dead = set(solver.dead_squares(wh))
+        assert dead <= inside and not dead & set(wh.targets)
+        assert set(solver.find_taboo_cells(wh)) & inside <= dead
+    # A dead end below a corner, that the two taboo rules miss
+    assert dead - set(solver.find_taboo_cells(wh)) == {(12, 8), (12, 9)}
+
+
+def test_components_after_push_matches_full_recompute(load):
+    wh = load('035')
+    puzzle = solver.SokobanPushPuzzle(wh)
+    reference = solver.SokobanPushPuzzle(wh).reachability
+    rng = random.Random(0)
+    state = puzzle.initial
+    for _ in range(200):
+        pushes = list(puzzle.successors(state))
+        if not pushes:
+            state = puzzle.initial
+            continue
+        ((box, _), next_state, _) = rng.choice(pushes)
+        boxes = frozenset(state.boxes)
+        puzzle.reachability.components(boxes)
+        new_box = (set(next_state.boxes) - boxes).pop()
+        incremental = puzzle.reachability.components_after_push(boxes, box, new_box)
+        reference.component_cache.clear()
+        assert incremental == reference.components(frozenset(next_state.boxes))
+        state = next_state
+    assert puzzle.reachability.incremental_updates > 0
+
+
+def test_reachability_counters_are_reported(load):
+    report = {}
+    plan, cost = solver.solve_weighted_sokoban(load('001'), corral=True, report=report)
+    assert cost == 33
+    assert report['reachability_incremental_updates'] > 0
+    assert report['reachability_component_hits'] > 0
+
+
+def test_reachability_distances_cached_per_key(load):
+    puzzle = solver.SokobanPushPuzzle(load('035'), cache_size=2)
+    cache = puzzle.reachability
+    boxes = frozenset(puzzle.initial.boxes)
+    workers = sorted(cache.distances(boxes, puzzle.initial.worker))[:3]
+    first = cache.distances(boxes, workers[0])
+    assert first[workers[0]] == 0
+    # Alternating between two keys hits the cache
+    assert cache.distances(boxes, workers[1]) is not first
+    assert cache.distances(boxes, workers[0]) is first
+    hits, misses = cache.distance_hits, cache.distance_misses
+    # A third key evicts the least recently used one
+    cache.distances(boxes, workers[2])
+    assert cache.distances(boxes, workers[0]) is first
+    assert (boxes, workers[1]) not in cache.distance_cache
+    assert (cache.distance_hits, cache.distance_misses) == (hits + 1, misses + 1)
+    # IDA* expands the same states at every iteration
+    report = {}
+    assert solver.solve_weighted_sokoban(load('023'), engine='idastar', report=report)[1] == 56
+    assert report['reachability_distance_hits'] > report['reachability_distance_misses']
+
+
+def test_actions_match_successors(load):
+    for puzzle_class in [solver.SokobanPuzzle, solver.BitboardSokobanPuzzle]:
+        puzzle = puzzle_class(load('035'))
+        puzzle.matching_check = True
+        rng = random.Random(0)
+        state = puzzle.initial
+        for _ in range(300):
+            moves = list(puzzle.successors(state))
+            assert puzzle.actions(state) == [action for action, _, _ in moves]
+            for action, next_state, _ in moves:
+                assert puzzle.result(state, action) == next_state
+            state = rng.choice(moves)[1] if moves else puzzle.initial
+
+
+def test_corral_deadlocks_keep_least_cost(load):
+    report = {}
+    plan, cost = solver.solve_weighted_sokoban(load('035'), corral=True, report=report)
+    assert cost == 77
+    assert report['corral_deadlock'] > 0
+    assert 'pi_corral' not in report
+
+
+def test_pi_corral_is_not_least_cost(load):
+    assert solver.is_least_cost({'corral': True})
+    assert not solver.is_least_cost({'pi_corral': True})
+    plan, cost = solver.solve_weighted_sokoban(load('035'), pi_corral=True)
+    assert cost >= 77
+
+
+def test_portfolio_ignores_exhausted_strategies(load):
+    strategies = {'starved': {'budget': solver.search.SearchBudget(max_nodes=1)},
+                  'push': {}}
+    report = {}
+    plan, cost = solver.solve_weighted_sokoban_portfolio(load('035'), strategies, 120, report)
+    assert cost == 77
+    assert report['strategy'] == 'push' and report['proven']
+    assert report['exhausted'] == {'starved': 'nodes'}
+
+    starved = {'starved': {'budget': solver.search.SearchBudget(max_nodes=1)}}
+    assert solver.solve_weighted_sokoban_portfolio(load('035'), starved, 120) == (None, None)
+
+
+def test_push_child_nodes_match_successors(load):
+    # The original search.py builds the children with actions, result and path_cost
+    puzzle = solver.SokobanPushPuzzle(load('035'))
+    rng = random.Random(0)
+    state = puzzle.initial
+    for _ in range(200):
+        before = sum(puzzle.pruned.values())
+        moves = list(puzzle.successors(state))
+        pruned = sum(puzzle.pruned.values()) - before
+        node = solver.search.Node(state)
+        children = [node.child_node(puzzle, action) for action in puzzle.actions(state)]
+        assert [(child.action, child.state, child.path_cost) for child in children] == moves
+        # result and path_cost do not generate the pushes again
+        assert sum(puzzle.pruned.values()) - before == 2 * pruned
+        state = rng.choice(moves)[1] if moves else puzzle.initial
+
+
+def test_default_push_expansion_reuses_walking_distances(load):
+    # Default options, children built as by the original search.py
+    problem, _ = solver.make_sokoban_problem(load('035'))
+    node = solver.search.Node(problem.initial)
+    actions = problem.actions(node.state)
+    children = [node.child_node(problem, action) for action in actions]
+    stats = problem.reachability.stats()
+    assert stats['distance_misses'] == 1
+    assert stats['distance_hits'] == len(children) > 0
+
+    report = {}
+    solver.solve_weighted_sokoban(load('035'), report=report)
+    assert report['reachability_distance_misses'] > 0
+
+
+def test_portfolio_runs_strategies_in_turn_without_fork(monkeypatch, load):
+    monkeypatch.setattr(solver.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    strategies = {'starved': {'budget': solver.search.SearchBudget(max_nodes=1)},
+                  'greedy': {'engine': 'greedy'},
+                  'push': {}}
+    report = {}
+    plan, cost = solver.solve_weighted_sokoban_portfolio(load('035'), strategies, 120, report)
+    assert cost == 77
+    assert report['strategy'] == 'push' and report['proven']
+    assert report['exhausted'] == {'starved': 'nodes'}
+
+    # Out of time: the strategies are stopped by a deadline budget
+    assert solver.solve_weighted_sokoban_portfolio(load('035'), {'push': {}}, 0) == (None, None)
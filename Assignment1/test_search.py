@@ -0,0 +1,510 @@
+'''
+
+Tests of the search engines of search.py on Sokoban problems, run with
+pytest from this directory.
+
+'''
+
+import os
+import random
+import types
+
+import pytest
+
+import mySokobanSolver as solver
+import search
+import testing
+import trace_histogram
+
+
+def test_indexed_priority_queue_pops_in_f_order():
+    queue = search.IndexedPriorityQueue(f=lambda item: item[1], key=lambda item: item[0])
+    queue.extend([('a', 5), ('b', 1), ('c', 3)])
+    assert [queue.pop() for _ in range(3)] == [('b', 1), ('c', 3), ('a', 5)]
+    with pytest.raises(Exception):
+        queue.pop()
+
+    queue = search.IndexedPriorityQueue('max', f=lambda item: item)
+    queue.extend([2, 7, 4])
+    assert queue.pop() == 7
+
+
+def test_indexed_priority_queue_replaces_items_lazily():
+    queue = search.IndexedPriorityQueue(f=lambda item: item[1], key=lambda item: item[0])
+    queue.extend([('a', 5), ('b', 1), ('c', 3)])
+    # Replace 'a' by a cheaper item and delete 'b': their old entries stay in the heap
+    queue.append(('a', 0))
+    del queue[('b', None)]
+    assert len(queue.heap) == 4 and len(queue) == 2
+    assert ('a', None) in queue and ('b', None) not in queue
+    assert queue[('a', None)] == 0
+    assert sorted(queue.items()) == [('a', 0), ('c', 3)]
+    with pytest.raises(KeyError):
+        queue[('b', None)]
+    with pytest.raises(KeyError):
+        del queue[('b', None)]
+    # The stale entries are skipped
+    assert [queue.pop() for _ in range(len(queue))] == [('a', 0), ('c', 3)]
+    assert len(queue) == 0 and not queue.items()
+    with pytest.raises(Exception):
+        queue.pop()
+
+
+def test_indexed_priority_queue_matches_priority_queue(load, replay):
+    for name in ['001', '021', '031']:
+        plans = [solver.solve_weighted_sokoban(load(name), frontier=frontier)
+                 for frontier in ['heap', 'priority_queue']]
+        assert plans[0][1] == plans[1][1]
+        assert replay(load(name), plans[0][0]) == plans[0][1]
+
+
+def test_bucket_priority_queue_tie_breaks():
+    # (name, f, g) items
+    items = [('a', 2, 0), ('b', 1, 0), ('c', 2, 1), ('d', 2, 0), ('e', 1, 1)]
+    f, g, key = (lambda item: item[1]), (lambda item: item[2]), (lambda item: item[0])
+    expected = {'lifo': 'ebdca',
+                'fifo': 'beacd',
+                'high_g': 'ebcda'}
+    for tie_break, order in expected.items():
+        queue = search.BucketPriorityQueue(f, key, tie_break, g)
+        queue.extend(items)
+        assert ''.join(queue.pop()[0] for _ in range(len(items))) == order
+        with pytest.raises(Exception):
+            queue.pop()
+    with pytest.raises(ValueError):
+        search.BucketPriorityQueue(tie_break='random')
+
+
+def test_bucket_priority_queue_high_g_pops_the_highest_g():
+    f, g, key = (lambda item: item[1]), (lambda item: item[2]), (lambda item: item[0])
+    queue = search.BucketPriorityQueue(f, key, 'high_g', g)
+    live = {}
+    rng = random.Random(0)
+    for _ in range(3000):
+        if live and rng.random() < 0.4:
+            item = queue.pop()
+            assert (f(item), -g(item)) == min((f(other), -g(other)) for other in live.values())
+            del live[key(item)]
+        else:
+            # Reused keys replace their item, reused g values refill emptied lists
+            item = (rng.randrange(100), rng.randrange(4), rng.randrange(6))
+            queue.append(item)
+            live[key(item)] = item
+    assert len(queue) == len(live)
+
+
+def test_bucket_priority_queue_skips_stale_entries():
+    f, g, key = (lambda item: item[1]), (lambda item: item[2]), (lambda item: item[0])
+    for tie_break in ['lifo', 'fifo', 'high_g']:
+        queue = search.BucketPriorityQueue(f, key, tie_break, g)
+        queue.extend([('a', 2, 0), ('b', 1, 0), ('c', 2, 1), ('d', 2, 0), ('e', 1, 1)])
+        # A replaced and a deleted item leave stale entries behind
+        queue.append(('a', 1, 1))
+        del queue[('d',)]
+        assert len(queue) == 4 and ('d',) not in queue and queue[('a',)] == 1
+        with pytest.raises(KeyError):
+            del queue[('d',)]
+        assert sorted(queue.pop()[0] for _ in range(4)) == ['a', 'b', 'c', 'e']
+
+
+def test_bucket_frontier_finds_least_cost(load, replay):
+    for name in ['001', '021', '031']:
+        expected = solver.solve_weighted_sokoban(load(name))[1]
+        plan, cost = solver.solve_weighted_sokoban(load(name), frontier='bucket')
+        assert cost == expected and replay(load(name), plan) == cost
+
+
+def test_heuristic_cache_evicts_by_policy():
+    calls = []
+
+    def h(node):
+        calls.append(node.state)
+        return len(node.state)
+
+    for policy, kept in [('lru', ['a', 'ccc']), ('fifo', ['bb', 'ccc'])]:
+        cache = search.HeuristicCache(h, maxsize=2, policy=policy)
+        assert [cache(search.Node(state)) for state in ['a', 'bb', 'a', 'ccc']] == [1, 2, 1, 3]
+        assert list(cache.cache) == kept
+        assert (cache.hits, cache.misses) == (1, 3)
+        assert cache.hit_rate() == 0.25
+    with pytest.raises(ValueError):
+        search.HeuristicCache(h, policy='random')
+    assert search.HeuristicCache(h).hit_rate() == 0.0
+
+
+def test_heuristic_cache_shares_values_by_key(load):
+    problem = solver.SokobanPuzzle(load('001'))
+    h = search.HeuristicCache(problem.push_distance_heuristic, key=lambda node: node.state.boxes)
+    assert search.astar_graph_search(problem, h).path_cost == 33
+    # Walking moves keep the boxes in place, so most calls are hits
+    assert h.hits > h.misses > 0
+    assert h.hits + h.misses > len(h.cache)
+
+
+def test_idastar_matches_astar_cost(load, replay):
+    for name in ['001', '021', '023', '031']:
+        expected = solver.solve_weighted_sokoban(load(name))[1]
+        plan, cost = solver.solve_weighted_sokoban(load(name), engine='idastar')
+        assert cost == expected
+        assert replay(load(name), plan) == cost
+
+
+def test_idastar_small_transposition_table_stays_optimal(load):
+    problem, h = solver.make_sokoban_problem(load('031'))
+    assert search.idastar_search(problem, h, table_size=10).path_cost == 17
+    # The table also cuts the cycles of the walking moves
+    problem, h = solver.make_sokoban_problem(load('021'), mode='step')
+    assert search.idastar_search(problem, h, table_size=50).path_cost == 17
+
+
+def test_idastar_budget_and_no_solution(load, from_lines):
+    problem, h = solver.make_sokoban_problem(load('035'))
+    result = search.idastar_search(problem, h, budget=search.SearchBudget(max_nodes=10))
+    assert isinstance(result, search.BudgetExhausted) and result.reason == 'nodes'
+    assert h(search.Node(problem.initial)) <= result.bound <= 77
+    # A box in a corner cannot be pushed to the target
+    problem, h = solver.make_sokoban_problem(from_lines(['#######',
+                                                         '#$  . #',
+                                                         '#  @  #',
+                                                         '#######']))
+    assert search.idastar_search(problem, h) is None
+
+
+def test_bucket_priority_queue_items_rebuild_the_queue():
+    f, g, key = (lambda item: item[1]), (lambda item: item[2]), (lambda item: item[0])
+    for tie_break in ['lifo', 'fifo', 'high_g']:
+        queue = search.BucketPriorityQueue(f, key, tie_break, g)
+        queue.extend([('a', 2, 0), ('b', 1, 0), ('c', 2, 1), ('d', 2, 0), ('e', 1, 1)])
+        # A replaced and a deleted item leave stale entries behind
+        queue.append(('a', 1, 1))
+        del queue[('d',)]
+        assert sorted(queue.items()) == [('a', 1, 1), ('b', 1, 0), ('c', 2, 1), ('e', 1, 1)]
+        copy = search.BucketPriorityQueue(f, key, tie_break, g)
+        copy.extend(queue.items())
+        assert [copy.pop() for _ in range(4)] == [queue.pop() for _ in range(4)]
+        assert not queue.items()
+
+
+def test_search_stats_counters_match_hooks(load):
+    stats = search.SearchStats()
+    events = {event: [] for event in search.SearchStats.EVENTS}
+    for event in events:
+        stats.add_hook(event, events[event].append)
+    with pytest.raises(ValueError):
+        stats.add_hook('prune', print)
+    report = {}
+    plan, cost, returned = solver.solve_weighted_sokoban(load('023'), report=report, return_stats=stats)
+    assert returned is stats and cost == 56
+    assert stats.expanded == len(events['expand']) > 0
+    assert stats.generated == len(events['generate']) >= stats.expanded
+    assert stats.duplicates == len(events['duplicate']) > 0
+    assert stats.reopened == len(events['reopen']) > 0
+    assert [node.path_cost for node in events['goal']] == [56]
+    assert 0 < stats.frontier_max <= stats.generated
+    assert stats.elapsed > 0
+    assert stats.counters['freeze'] == report['freeze'] > 0
+    assert set(stats.as_dict()) == {'expanded', 'generated', 'duplicates', 'reopened',
+                                    'frontier_max', 'elapsed', 'timings', 'counters'}
+
+
+def test_default_successors_use_actions_result_and_path_cost():
+    class Line(search.Problem):
+        """ Walk right along a line, a step of n cells costs n * n. """
+        def actions(self, state):
+            return [1, 2]
+
+        def result(self, state, action):
+            return state + action
+
+        def path_cost(self, c, state1, action, state2):
+            return c + action * action
+
+    problem = Line(0, 4)
+    assert list(problem.successors(3)) == [(1, 4, 1), (2, 5, 4)]
+    node = search.Node(3, path_cost=10)
+    children = [node.child_node(problem, action) for action in problem.actions(3)]
+    assert [(child.action, child.state, child.path_cost) for child in node.expand(problem)] == \
+        [(child.action, child.state, child.path_cost) for child in children] == [(1, 4, 11), (2, 5, 14)]
+    # The calls made by the default successors are timed as successors
+    stats = search.SearchStats(timed=True)
+    assert search.astar_graph_search(problem, lambda node: 0, stats=stats).path_cost == 4
+    assert 'successors' in stats.timings and 'actions' not in stats.timings
+
+
+def test_timed_problem_records_timings(load):
+    problem, h = solver.make_sokoban_problem(load('001'))
+    stats = search.SearchStats(timed=True)
+    timed = stats.begin(problem)
+    assert isinstance(timed, search.TimedProblem)
+    # The other attributes are the problem's
+    assert timed.initial == problem.initial and timed.weights == problem.weights
+    assert timed.goal_test(problem.initial) == problem.goal_test(problem.initial)
+    assert len(timed.successors(problem.initial)) == len(list(problem.successors(problem.initial)))
+    assert set(stats.timings) == {'goal_test', 'successors'}
+
+    stats = search.SearchStats(timed=True)
+    assert search.astar_graph_search(problem, h, stats=stats).path_cost == 33
+    assert stats.timings['goal_test'] > 0 and stats.timings['h'] > 0
+    assert sum(stats.timings.values()) <= stats.elapsed
+    # Untimed statistics leave the problem alone
+    assert search.SearchStats().begin(problem) is problem
+
+
+def test_arastar_yields_goal_found_before_deadline(monkeypatch, load):
+    # A fake clock that passes the deadline as soon as a goal is generated,
+    # in the middle of the first weighted search
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(search, 'time', types.SimpleNamespace(perf_counter=lambda: clock.now))
+    problem, h = solver.make_sokoban_problem(load('035'))
+    goal_test = problem.goal_test
+
+    def timed_goal_test(state):
+        if goal_test(state):
+            clock.now = 10.0
+            return True
+        return False
+
+    problem.goal_test = timed_goal_test
+    plans = list(search.arastar_search(problem, h, epsilon=3.0, deadline=5.0))
+    assert len(plans) == 1
+    node, bound = plans[0]
+    assert goal_test(node.state)
+    assert node.path_cost >= 77
+    assert bound >= node.path_cost / 77 - 1e-9
+
+
+def test_arastar_tells_the_deadline_from_no_solution(load):
+    problem, h = solver.make_sokoban_problem(load('003_impossible'))
+    assert list(search.arastar_search(problem, h)) == []
+    assert solver.solve_weighted_sokoban_anytime(load('003_impossible'), 60.0) == ('Impossible', None, None)
+    # The deadline has passed before the first expansion
+    problem, h = solver.make_sokoban_problem(load('035'))
+    assert list(search.arastar_search(problem, h, deadline=0.0)) == [(None, float('inf'))]
+    assert solver.solve_weighted_sokoban_anytime(load('035'), 0.0) == (None, None, None)
+
+
+def test_hdastar_matches_astar_cost(load, replay):
+    for name in ['001', '021', '023', '031']:
+        expected = solver.solve_weighted_sokoban(load(name))[1]
+        plan, cost = solver.solve_weighted_sokoban(load(name), engine='hdastar', workers=2)
+        assert cost == expected
+        assert replay(load(name), plan) == cost
+
+
+def test_hdastar_counts_the_expansions_of_the_workers(load):
+    astar = solver.solve_weighted_sokoban(load('023'), return_stats=True)[2]
+    for workers in [1, 2]:
+        stats = search.SearchStats()
+        goals = []
+        stats.add_hook('goal', goals.append)
+        plan, cost, _ = solver.solve_weighted_sokoban(load('023'), engine='hdastar', workers=workers,
+                                                      return_stats=stats)
+        assert cost == 56 and stats.elapsed > 0 and [node.path_cost for node in goals] == [56]
+        # The expansions happen in the worker processes
+        assert stats.generated >= stats.expanded > astar.expanded // 2
+
+
+def test_hdastar_raises_if_a_process_dies_while_collecting_the_plan(monkeypatch, load):
+    worker = search._hdastar_worker
+
+    class DyingReplies:
+        """ Replies of a process that dies instead of sending a parent link. """
+        def __init__(self, replies):
+            self.replies = replies
+
+        def put(self, message):
+            if message is not None and len(message) == 3:
+                os._exit(0)
+            self.replies.put(message)
+
+    def dying_worker(index, problem, h, inboxes, replies, *args):
+        worker(index, problem, h, inboxes, DyingReplies(replies), *args)
+
+    monkeypatch.setattr(search, '_hdastar_worker', dying_worker)
+    problem, h = solver.make_sokoban_problem(load('001'))
+    with pytest.raises(RuntimeError):
+        search.hdastar_search(problem, h, workers=2, reply_timeout=0.1)
+
+
+def test_checkpoint_resume_returns_the_same_plan(tmp_path, load):
+    path = str(tmp_path / 'search.ckpt')
+    expected = solver.solve_weighted_sokoban(load('035'))
+    budget = search.SearchBudget(max_nodes=500)
+    result, cost = solver.solve_weighted_sokoban(load('035'), budget=budget,
+                                                 checkpoint=search.SearchCheckpoint(path))
+    assert isinstance(result, search.BudgetExhausted) and cost is None
+    assert os.path.exists(path)
+
+    plan, cost = solver.solve_weighted_sokoban(load('035'), checkpoint=search.SearchCheckpoint(path))
+    assert (plan, cost) == expected
+    assert not os.path.exists(path)
+
+
+def test_checkpoint_removed_when_initial_state_is_a_goal(tmp_path, load):
+    path = str(tmp_path / 'search.ckpt')
+    wh = load('001')
+    solved = wh.copy(boxes=list(wh.targets), weights=wh.weights)
+    for run in [lambda checkpoint: solver.solve_weighted_sokoban(solved, checkpoint=checkpoint),
+                lambda checkpoint: search.astar_graph_search(
+                    *solver.make_sokoban_problem(solved), checkpoint=checkpoint)]:
+        with open(path, 'w') as f:
+            f.write('stale')
+        run(search.SearchCheckpoint(path))
+        assert not os.path.exists(path)
+
+
+def test_bidirectional_matches_astar_cost(load, replay):
+    for name in ['001', '021', '031', '035']:
+        expected = solver.solve_weighted_sokoban(load(name))[1]
+        plan, cost = solver.solve_weighted_sokoban(load(name), engine='bidirectional')
+        assert cost == expected
+        assert replay(load(name), plan) == cost
+
+
+def test_bidirectional_meets_in_the_middle(load):
+    problem, h = solver.make_sokoban_problem(load('035'))
+    backward = solver.SokobanPullPuzzle(problem)
+    node, backward_node = search.bidirectional_astar_search(problem, backward, h, backward.heuristic)
+    assert backward_node is not None and node.state == backward_node.state
+    assert node.path_cost + backward_node.path_cost == 77
+
+
+def test_pull_puzzle_rejects_too_many_solved_states(monkeypatch, load, from_lines):
+    # 9 boxes of distinct weights: 9! solved configurations
+    lines = ['1 2 3 4 5 6 7 8 9',
+             '###########',
+             '#@$$$$$$$$$#',
+             '#.........#',
+             '#         #',
+             '###########']
+    wh = from_lines(lines)
+    problem = solver.SokobanPushPuzzle(wh)
+    assert solver.SokobanPullPuzzle.count_roots(problem) > solver.SokobanPullPuzzle.max_roots
+    with pytest.raises(ValueError):
+        solver.SokobanPullPuzzle(problem)
+
+    # The bidirectional engine then searches forward only
+    monkeypatch.setattr(solver.SokobanPullPuzzle, 'max_roots', 0)
+    report = {}
+    plan, cost = solver.solve_weighted_sokoban(load('035'), engine='bidirectional', report=report)
+    assert cost == 77 and report['engine'] == 'astar'
+
+
+def test_checkpoint_rejected_with_priority_queue_frontier(tmp_path, load):
+    path = str(tmp_path / 'search.ckpt')
+    with pytest.raises(ValueError):
+        solver.solve_weighted_sokoban(load('035'), frontier='priority_queue',
+                                      checkpoint=search.SearchCheckpoint(path))
+    assert not os.path.exists(path)
+    assert solver.solve_weighted_sokoban(load('001'), frontier='priority_queue')[1] == 33
+    # The search itself rejects a frontier that cannot list its items
+    problem, h = solver.make_sokoban_problem(load('035'))
+    with pytest.raises(ValueError):
+        search.astar_graph_search(problem, h, lambda f, key: search.PriorityQueue('min', f),
+                                  budget=search.SearchBudget(max_nodes=10),
+                                  checkpoint=search.SearchCheckpoint(path))
+    assert not os.path.exists(path)
+
+
+def test_budget_node_limit_returns_lower_bound(load):
+    problem, h = solver.make_sokoban_problem(load('035'))
+    stats = search.SearchStats()
+    budget = search.SearchBudget(max_nodes=50)
+    result = search.astar_graph_search(problem, h, stats=stats, budget=budget)
+    assert isinstance(result, search.BudgetExhausted)
+    assert result.reason == 'nodes' and result.expanded == 50
+    assert result.stats is stats and stats.expanded == 50
+    # A* expands by increasing f, so the f of the next node bounds the least cost
+    assert 0 < result.bound <= 77
+
+    # The budget is shared: a second search under it stops at once
+    again = search.astar_graph_search(*solver.make_sokoban_problem(load('035')), budget=budget)
+    assert again.reason == 'nodes' and again.expanded == 50
+
+
+def test_budget_cancellation_and_deadline(load):
+    token = search.CancellationToken()
+    token.cancel()
+    for budget, reason in [(search.SearchBudget(token=token), 'cancelled'),
+                           (search.SearchBudget(deadline=0.0), 'deadline')]:
+        for engine in ['astar', 'idastar', 'greedy', 'bidirectional']:
+            result, cost = solver.solve_weighted_sokoban(load('035'), engine=engine, budget=budget)
+            assert isinstance(result, search.BudgetExhausted) and cost is None
+            assert result.reason == reason and result.expanded == 0
+
+
+def test_budget_large_enough_finds_the_plan(load):
+    budget = search.SearchBudget(max_nodes=10 ** 6, deadline=float('inf'), token=search.CancellationToken())
+    assert solver.solve_weighted_sokoban(load('035'), budget=budget)[1] == 77
+    assert 0 < budget.expanded < 10 ** 6
+
+
+def test_testing_time_limit_covers_the_whole_solve(tmp_path):
+    report = str(tmp_path / 'report.txt')
+    warehouses = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouses')
+    # The solve runs in this process and the deadline is already past when
+    # the search starts
+    solution, time_taken, cost = testing.test_warehouse(os.path.join(warehouses, 'warehouse_035.txt'),
+                                                        report, time_limit=0)
+    assert (solution, time_taken) == ('Not Solved', 'Timeout') and cost.startswith('N/A (at least ')
+    solution, time_taken, cost = testing.test_warehouse(os.path.join(warehouses, 'warehouse_001.txt'),
+                                                        report, time_limit=60)
+    assert (solution, cost) == ('Solved', 33) and time_taken < 60
+
+
+def test_hdastar_runs_astar_without_fork(monkeypatch, load, replay):
+    monkeypatch.setattr(search.multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    assert search.fork_context() is None
+    plan, cost = solver.solve_weighted_sokoban(load('035'), engine='hdastar', workers=2)
+    assert cost == 77 and replay(load('035'), plan) == cost
+
+
+def test_expansion_tracer_formats(tmp_path, capsys, load):
+    paths = {}
+    for fmt in ['jsonl', 'chrome']:
+        paths[fmt] = str(tmp_path / ('trace.' + fmt))
+        stats = search.SearchStats()
+        with search.ExpansionTracer(paths[fmt], format=fmt, fields=solver.pushed_box,
+                                    buffer_size=7) as tracer:
+            tracer.attach(stats)
+            assert solver.solve_weighted_sokoban(load('035'), return_stats=stats)[1] == 77
+        assert tracer.written == stats.expanded and tracer.dropped == 0
+
+    records = trace_histogram.load_trace(paths['jsonl'])
+    # The same records, with the time stamp outside the args of the Chrome events
+    chrome = trace_histogram.load_trace(paths['chrome'])
+    assert chrome == [{k: v for k, v in r.items() if k != 't'} for r in records]
+    assert records[0]['depth'] == 0 and 'box' not in records[0]
+    assert all(r['f'] == r['g'] + r['h'] for r in records)
+    assert all(len(r['box']) == 2 for r in records[1:])
+    # The f values of A* with a consistent heuristic never decrease
+    assert max(r['f'] for r in records) <= 77
+
+    # A Chrome trace cut off before its closing bracket is still read
+    with open(paths['chrome']) as f:
+        text = f.read()
+    with open(paths['chrome'], 'w') as f:
+        f.write(text.rstrip().rstrip(']').rstrip())
+    assert len(trace_histogram.load_trace(paths['chrome'])) == len(records)
+
+    trace_histogram.main([paths['jsonl'], '--bins', '5'])
+    out = capsys.readouterr().out
+    assert out.startswith('{} expansions'.format(len(records)))
+    assert 'f values' in out and 'Depths' in out
+
+
+def test_expansion_tracer_max_records(tmp_path, load):
+    path = str(tmp_path / 'trace.jsonl')
+    stats = search.SearchStats()
+    with search.ExpansionTracer(path, max_records=10) as tracer:
+        tracer.attach(stats)
+        solver.solve_weighted_sokoban(load('035'), return_stats=stats)
+    assert tracer.written == 10 and tracer.dropped == stats.expanded - 10
+    assert len(trace_histogram.load_trace(path)) == 10
+
+
+def test_trace_histogram_bins():
+    assert trace_histogram.histogram([3, 1, 3, 2]) == [((1, 2), 1), ((2, 3), 1), ((3, 4), 2)]
+    hist = trace_histogram.histogram([0.0, 0.5, 10.0], bins=2)
+    assert [count for _, count in hist] == [2, 1]
+    assert trace_histogram.histogram([None]) == []
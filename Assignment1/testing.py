@@ -1,6 +1,7 @@
 import os
 import glob
 import sokoban
+import search
 # importing functions individually for sanity_check
 import mySokobanSolver as solver
 import re
@@ -100,9 +101,13 @@ def load_warehouse(file_path, report_path):
 
 # testing load_warehouse and classify_warehouse: both work as expected.
 
-def test_warehouse(file_path, report_path):
+def test_warehouse(file_path, report_path, time_limit=None):
     try: 
-        """ Test a warehouse by loading it and classifying it. """
+        """ Test a warehouse by loading it and classifying it.
+            The solver stops after time_limit seconds (None for no limit) and the
+            warehouse is then reported as not solved. The deadline starts before
+            the solver builds the puzzle and analyses it, so their time counts
+            against the limit, but they are not interrupted. """
         wh = load_warehouse(file_path, report_path)
         classify_warehouse(wh, report_path)
 
@@ -111,11 +116,20 @@ def test_warehouse(file_path, report_path):
 
         # Measure the time taken to solve the warehouse
         start_time = time.time()
-        result = solver.solve_weighted_sokoban(wh)  # Call the solver function to solve the warehouse.
+        budget = None
+        if time_limit is not None:
+            budget = search.SearchBudget(deadline=time.perf_counter() + time_limit)
+        # Call the solver function to solve the warehouse.
+        outcome = solver.solve_weighted_sokoban(wh, return_stats=True, budget=budget)
+        *result, stats = outcome
         time_taken = time.time() - start_time
-        
+        edit_report(report_path, f"Expanded: {stats.expanded}, Generated: {stats.generated}, "
+                                 f"Duplicates: {stats.duplicates}, Frontier max: {stats.frontier_max}")
 
-        if result == ("Impossible", None):
+        if isinstance(result[0], search.BudgetExhausted):
+            # Lower bound on the cost from the nodes left in the frontier
+            return "Not Solved", "Timeout", f"N/A (at least {result[0].bound})"
+        if result == ["Impossible", None]:
             solution = "Impossible"
         else:
             action, cost = result
@@ -141,12 +155,8 @@ def test_batch(start_warehouse, num_warehouses):
     # Display progress bar for the batch
     for file_path in tqdm(batch_files, desc="Testing warehouses", unit="warehouse"):
         full_file_path = os.path.join("./Assigment1/warehouses", file_path)  # Construct full path
-        func = partial(test_warehouse, full_file_path, report_path)
-        result = run_with_timeout(func, 60)  # 10 seconds timeout
-        if result is None:  # Timeout occurred
-            solution, time, cost = "Not Solved", "Timeout", "N/A"
-        else:
-            solution, time, cost = result
+        # The search stops itself after one minute
+        solution, time, cost = test_warehouse(full_file_path, report_path, time_limit=60)
         edit_report(report_path, f"Result: Solved? = {solution}, Time: {time} seconds, Cost: {cost}")
 
     return print(f"Batch test completed. Report saved to {report_path}.")
@@ -0,0 +1,85 @@
+"""
+    Offline tool turning an expansion trace (see search.ExpansionTracer)
+    into text histograms of the f values and depths of the expanded nodes.
+
+    Recording a trace of solve_weighted_sokoban:
+
+        stats = search.SearchStats()
+        with search.ExpansionTracer('trace.jsonl', fields=mySokobanSolver.pushed_box) as tracer:
+            tracer.attach(stats)
+            mySokobanSolver.solve_weighted_sokoban(warehouse, return_stats=stats)
+
+    Then:
+
+        python trace_histogram.py trace.jsonl
+
+    Both the JSONL and the Chrome trace formats are read.
+"""
+
+import sys
+import json
+import argparse
+import collections
+
+
+def load_trace(path):
+    """ Read the records of a trace file. Returns a list of dictionaries (g, h, f, depth, ...). """
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        # Chrome trace: the closing bracket is missing if the search was interrupted
+        text = text.strip().rstrip(',')
+        if not text.endswith(']'):
+            text += ']'
+        return [event['args'] for event in json.loads(text) if event.get('name') == 'expand']
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def histogram(values, bins=20):
+    """ Count the values in at most bins equal ranges.
+        Returns a list of ((low, high), count) with low inclusive and high exclusive
+        (the last range includes high).
+    """
+    values = [v for v in values if v is not None]
+    if not values:
+        return []
+    low, high = min(values), max(values)
+    # Integer values spanning fewer than bins values get one bin per value
+    if all(float(v).is_integer() for v in values) and high - low < bins:
+        counts = collections.Counter(values)
+        return [((v, v + 1), counts[v]) for v in range(int(low), int(high) + 1)]
+    width = (high - low) / bins or 1
+    counts = [0] * bins
+    for v in values:
+        counts[min(int((v - low) / width), bins - 1)] += 1
+    return [((low + i * width, low + (i + 1) * width), c) for i, c in enumerate(counts)]
+
+
+def print_histogram(title, hist, width=50):
+    """ Print a histogram as rows of '#' scaled to width characters. """
+    print(title)
+    if not hist:
+        print('  (no values)')
+        return
+    largest = max(count for _, count in hist)
+    for (low, high), count in hist:
+        label = f"{low:g}" if high - low == 1 and float(low).is_integer() else f"{low:.1f}-{high:.1f}"
+        bar = '#' * round(width * count / largest) if largest else ''
+        print(f"  {label:>13} {count:>8} {bar}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Histograms of the f values and depths of an expansion trace.',
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', help='JSONL or Chrome trace file written by search.ExpansionTracer')
+    parser.add_argument('--bins', type=int, default=20, help='maximum number of bins per histogram')
+    args = parser.parse_args(argv)
+
+    records = load_trace(args.trace)
+    print(f"{len(records)} expansions")
+    print_histogram('f values', histogram([r.get('f') for r in records], args.bins))
+    print_histogram('Depths', histogram([r.get('depth') for r in records], args.bins))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])